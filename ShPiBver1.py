@@ -12,10 +12,9 @@ from datetime import datetime
 from signal import pause
 import cv2
 import os
-import numpy as np
 import subprocess 
+import threading
 
-import smtplib
 from email.mime.multipart import MIMEMultipart # allows for attachments
 from email.mime.text import MIMEText
 from email.mime.base import MIMEBase
@@ -23,19 +22,46 @@ from email import encoders
 from email.message import EmailMessage
 from email.utils import formataddr
 from credentials import email_creds
+import pipeline
+from worker import ProcessingWorker
+from mailer import Outbox, SMTPPool, POOL_SIZE
+from faces import FaceDetector, FaceTracker
+from capture_config import photo_size, lores_size, pick_sensor_mode, check_capture_size
 
 creds = email_creds()
 
+# worker processes are forked before the camera starts its threads
+worker = ProcessingWorker()
+worker.start()
+
 button = Button(23)   # GPIO 23 is intialized as 'button'
 camera = Picamera2()  # the connected camera is intialized as 'camera'
-camera.start()
 
-haar_cascade_path = '/home/pi1/Downloads/haarcascade_frontalface_default.xml'
+# tracker gets its own detector, the one in pipeline.py lives in the worker processes
+face_tracker = FaceTracker(camera, FaceDetector(pipeline.face_cascade, mode='fast'))
+
+#*#*# CHANGE ME *#*#*#
+CARTOON_TIMEOUT = 120     # seconds a cartoon job may take before it is given up on (a 12MP full render is ~10s)
+RETAKES_AFTER_ERROR = 2   # automatic retakes after a failed cartoon, then the booth asks for staff
+
+#*#*# CHANGE ME *#*#*# 'RGB888' hands OpenCV a BGR array, 'YUV420' also gives the Y plane as a free grayscale image
+CAPTURE_FORMAT = 'RGB888'
+# capture exactly the photo window of the comic frame, the sensor mode is the smallest
+# one covering it so the ISP only scales down and nothing gets processed then thrown away
+photo_window = photo_size(pipeline.frame_cache.shape())
+sensor_mode = pick_sensor_mode(camera.sensor_modes, photo_window)
+# small lores stream (same shape as main) lets faces be tracked during the countdown
+camera.configure(camera.create_preview_configuration(main={'size': photo_window, 'format': CAPTURE_FORMAT},
+	lores={'size': lores_size(photo_window)},
+	sensor={'output_size': sensor_mode['size'], 'bit_depth': sensor_mode['bit_depth']}))
+check_capture_size(camera.camera_config['main']['size'], photo_window)
+camera.start()
 
-if not os.path.exists(haar_cascade_path):
-	print("Haar Cascade XML file not found at the specified location.")
-else:
-	face_cascade = cv2.CascadeClassifier(haar_cascade_path)
+# emails wait in /home/pi1/outbox until the Union routers let them through, nothing is lost on a restart
+# sent over a small pool of logged-in connections instead of a new TLS handshake per email
+smtp_pool = SMTPPool(creds)
+outbox = Outbox(smtp_pool.send, senders=POOL_SIZE)
+outbox.start()
 
 def show_image(file_path):  # Added this function
 	try:
@@ -46,116 +72,32 @@ def show_image(file_path):  # Added this function
 	except subprocess.CalledProcessError as e:  # Adding exception handling
 		print(f"Failed to open image with feh: {e}") 
 		
-def add_frame(background, choice): #takes in openCV image (of picture taken)
-	#add alpha channel to picture
-	background = cv2.cvtColor(background, cv2.COLOR_BGR2BGRA) # the flip
-	background[:, :, 3] = 255 # 255
-	#*#*# CHANGE ME *#*#*#
-	if 'Expression' in choice:
-		foreground = cv2.imread("/home/pi1/Pink_Comic_CFE_Final_2.png", cv2.IMREAD_UNCHANGED) 
-	elif 'Scientific' in choice:
-		foreground = cv2.imread("/home/pi1/Blue_Comic_CSD_Final.png", cv2.IMREAD_UNCHANGED)
-	elif 'Justic' in choice:
-		foreground = cv2.imread("/home/pi1/Green_Comic_CSJ_Final_2.png", cv2.IMREAD_UNCHANGED) 
-	
-	# normalize alpha channels from 0-255 to 0-1
-	alpha_background = background[:,:,3] / 255.0
-	alpha_foreground = foreground[:,:,3] / 255.0
-	# set adjusted colors
-	for color in range(0, 3):
-		background[:,:,color] = alpha_foreground * foreground[:,:,color] + \
-			alpha_background * background[:,:,color] * (1 - alpha_foreground)
-			
-	# set adjusted alpha and denormalize back to 0-255
-	background[:,:,3] = (1 - (1 - alpha_foreground) * (1 - alpha_background)) * 255
-	return background
-			
-def smooth(image, faces):
-	# Start with a black mask
-	mask = np.zeros_like(image, dtype=np.uint8)
-	
-	for (x, y, w, h) in faces:
-		# Create a mask with an elliptical region (as before)
-		center = (x + w // 2, y + h // 2)
-		axes = (w // 2, h // 2)
-		cv2.ellipse(mask, center, axes, 0, 0, 360, (255, 255, 255), -1)  # Fill face with white
-
-	# Apply Gaussian blur to smooth out the edges of the face region (even softer)
-	mask = cv2.GaussianBlur(mask, (41, 41), 0)  # Larger blur kernel for softer edges
-
-	# Extract the face region by applying the mask (soft mask applied)
-	face_region = cv2.bitwise_and(image, mask)
-
-	# Normalize the face region's brightness if needed to match the rest of the image
-	face_region = cv2.convertScaleAbs(face_region, alpha=0.8, beta=-10)
-
-	return face_region
-
-
-
-def detect_face(image):
-	# Use OpenCV Haar Cascade for face detection
-	image_gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-	image_gray = cv2.equalizeHist(image_gray)
-	faces = face_cascade.detectMultiScale(image_gray, scaleFactor=1.05, minNeighbors=4, 
-		minSize=(30, 30))
-	return faces
-
-def process_image(file_path, choice):
-	image = cv2.imread(file_path) 
-	faces = detect_face(image)
-	face_image = smooth(image, faces)
-	gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) 
-	gray = cv2.medianBlur(gray, 7) #remove for other edge detection method  
-	edges = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C,
-								  cv2.THRESH_BINARY, 9, 5)
-   
-	#edges = cv2.Canny(gray, 100, 200)
-	#edges = cv2.normalize(edges, None, 0, 25, cv2.NORM_MINMAX).astype(np.uint8)
-	
-	# apply color quantization using KMeans
-	pixel_values = image.reshape((-1,3))
-	pixel_values = np.float32(pixel_values)
-	k = 8
-	_, labels, centers = cv2.kmeans(pixel_values, k, None, (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 100, 0.2), 10, cv2.KMEANS_RANDOM_CENTERS)
-	
-	centers = np.uint8(centers)
-	quantized_img = centers[labels.flatten()]
-	quantized_img = quantized_img.reshape(image.shape)
-	
-	
-	# Combine edges and quantized image
-	# Align the image to have edges in black and everything else in color.
-	cartoon_background = cv2.bitwise_and(quantized_img, quantized_img, mask=edges)
-	
-	# Blend smoothly the face region with the cartoonized background
-	final_image = cv2.addWeighted(cartoon_background, 1, face_image, 0.2, 0)
-	
-	# Enhance image contrast if needed
-	final_image = cv2.convertScaleAbs(final_image, alpha=1.3, beta=30)
-	
-	# Pad image edges + frame
-	top, bottom, left, right = 280, 200, 0, 0
-	padded_cartoon = cv2.copyMakeBorder(final_image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=[255, 255, 255])
-	final = add_frame(padded_cartoon, choice)
-	final_file_path = file_path.replace('photos', 'photos_cartoon').replace('.jpg', '_cart.jpg')
-	cv2.imwrite(final_file_path, final)
-	return final_file_path
-
 def capture(student_info):
 	name = student_info[0]
 	r1 = 'Y' if 'Y' in student_info[1] else 'N'
 	r2 = 'Y' if 'Y' in student_info[2] else 'N'
 	uniq = student_info[3] 
 	file_path = f'/home/pi1/photos/{uniq}_{name}_{r1}_{r2}.jpg' # save path defined
-	camera.capture_file(file_path) # capture_file, a picamera2 function
-	return file_path 
+	frame = camera.capture_array('main') # frame stays in memory, no JPEG round trip
+	image, gray = frame_to_bgr(frame)
+	# archive the raw photo in the background, processing doesn't wait on the SD card
+	threading.Thread(target=cv2.imwrite, args=(file_path, image)).start()
+	return file_path, image, gray
+
+def frame_to_bgr(frame):
+	""" camera array -> (BGR image, grayscale or None) """
+	if CAPTURE_FORMAT == 'YUV420':
+		# I420 comes back as one 2D array, Y plane on top, each row padded to the camera's stride;
+		# the padding converts along with the rest and is cropped off, like faces.lores_gray does
+		width, height = camera.camera_config['main']['size']
+		return cv2.cvtColor(frame, cv2.COLOR_YUV2BGR_I420)[:height, :width], frame[:height, :width]
+	return frame, None
  
 def pop_uniq_make_email(processed_img_path):
 	
 	full_path = processed_img_path
 
-	pattern = r"/home/pi1/photos_cartoon/([a-zA-Z]{3,8})_.*_[YN]_[YN]_[a-zA-Z]*.jpg$" 
+	pattern = r"/home/pi1/photos_cartoon/([a-zA-Z]{1,8})_.*_[YN]_[YN]_[a-zA-Z]*.jpg$" 
 	match = re.search(pattern, full_path)
 	
 	if match:
@@ -166,13 +108,13 @@ def pop_uniq_make_email(processed_img_path):
 	else:
 		print("No match found.")
 
-def send_email(processed_img_path):
-	# Email configuration
+def send_email(processed_img_path, attachment_path=None):
+	# Email configuration (address comes from the print file name, the attachment can be a smaller rendition)
 	email = pop_uniq_make_email(processed_img_path)
-	smtp_server = 'smtp.mail.umich.edu'
-	smtp_port = 587
+	if email is None:  # no uniqname in the file name, nobody to send it to
+		print(f'Not emailing {processed_img_path}, no address')
+		return
 	sender_email = creds['email']
-	sender_password = creds['password']
    
 	recipient_email = email
 	
@@ -204,9 +146,8 @@ def send_email(processed_img_path):
 	# Attach the body to the MIME message
 	msg.attach(MIMEText(html_content, 'html'))
 
-	attachment_path = processed_img_path
+	attachment_path = attachment_path or processed_img_path
 
-	# Send the email
 	try:
 		with open(attachment_path,'rb') as attachment:
 			part = MIMEBase('application', 'octet-stream')
@@ -220,18 +161,8 @@ def send_email(processed_img_path):
 	except Exception as e:
 		print(f'Failed to attach file: {e}')
 		
-	try:    
-		server = smtplib.SMTP(smtp_server, smtp_port)
-		server.starttls()  # Secure the connection
-		server.login(sender_email, sender_password)
-		server.send_message(msg)
-		#print('Email sent successfully!')
-
-	except Exception as e:
-		print(f'Failed to send email: {e}')
-
-	finally:
-		server.quit() 
+	# Queue the email on disk, the outbox thread sends it (and retries) in the background
+	outbox.enqueue(msg)
 
 def print_image(image_path):
 	print_command = (f'lp {image_path}')
@@ -260,7 +191,7 @@ def thanks_and_next_steps(win):  # Define stdscr as the parameter
 	time.sleep(5)
 
 
-def on_button_pressed(win, student_info):
+def on_button_pressed(win, student_info, errors=0):
 	big_numbers = {
 	5: [
 		"5555555",
@@ -308,6 +239,7 @@ def on_button_pressed(win, student_info):
 		" 11111 "
 	]}
 	choice = student_info[4]
+	face_tracker.start()  # look for faces on the preview stream while the countdown runs
 	for i in range(5, 0, -1):
 		win.clear()
 		win.attron(curses.color_pair(4))
@@ -324,9 +256,19 @@ def on_button_pressed(win, student_info):
 
 	time.sleep(1)
    
-	file_path = capture(student_info)
-	processed_img_path = process_image(file_path, choice)
-	show_image(processed_img_path)
+	faces = face_tracker.stop()
+	file_path, image, gray = capture(student_info)
+	# quick low-res cartoon for the Approve/Retake screen, full size starts right away next to it
+	# shrunk here, so only the small proxy goes through the job pipe
+	proxy, proxy_faces, proxy_gray = pipeline.preview_proxy(image, choice, faces, gray)
+	preview_id = worker.submit(proxy, file_path, choice, proxy_faces, proxy_gray, preview=True)
+	full_id = worker.submit(image, file_path, choice, faces, gray)
+	status, preview = wait_for_cartoon(win, preview_id)
+	if status == 'error':
+		worker.cancel(full_id)
+		retake_after_error(win, student_info, preview, errors)
+		return
+	show_image(preview['preview'])
 	
 	
 	win.clear()
@@ -339,13 +281,61 @@ def on_button_pressed(win, student_info):
 	user_choice = handle_approve_response2(win)  # New call to handle user response
 
 	if user_choice == "Approve":  # New logic branch
-		print_image(processed_img_path)
-		send_email(processed_img_path)
+		status, renditions = wait_for_cartoon(win, full_id)  # usually finished while they were deciding
+		if status == 'error':
+			retake_after_error(win, student_info, renditions, errors)
+			return
+		print_image(renditions['print'])
+		send_email(renditions['print'], renditions['email'])
 		thanks_and_next_steps(win)
 	elif user_choice == "Retake":  # New logic branch
+		worker.cancel(full_id)  # nobody needs the full-size render any more
 		win.clear()
 		win.refresh()
-		on_button_pressed(win,student_info)
+		on_button_pressed(win, student_info, errors)
+
+def retake_after_error(win, student_info, message, errors):
+	print(f'Failed to process photo: {message}')
+	win.clear()
+	win.border()
+	if errors >= RETAKES_AFTER_ERROR:
+		# the same error again and again (no cascade, wrong frame size...), a retake won't fix it
+		spool_text(win, "Sorry! Please ask a staff member for help.", 2, 5, 0.05)
+		win.addstr(8, 2, f"Cartoon failed {errors + 1} times: {message}"[:win.getmaxyx()[1] - 4], curses.color_pair(3))
+		win.refresh()
+		win.getch()  # staff read the error, then any key goes back to the start screen
+		return
+	spool_text(win, "Oops, let's try that again!", 2, 5, 0.05)
+	time.sleep(1)
+	on_button_pressed(win, student_info, errors + 1)
+
+def wait_for_cartoon(win, job_id, timeout=CARTOON_TIMEOUT):
+	""" keeps the screen moving while the worker cartoonizes the photo, returns ('done', renditions) or ('error', message) """
+	spinner = '|/-\\'
+	stage = 'Waiting for the cartoonizer'
+	tick = 0
+	deadline = time.monotonic() + timeout
+	win.clear()
+	while True:
+		for event_id, value in worker.poll():
+			if event_id == job_id:  # stages of the other job (preview / full size) aren't shown
+				stage = value
+		if job_id in worker.finished:
+			return worker.finished.pop(job_id)
+		if time.monotonic() > deadline:
+			worker.abandon(job_id)  # a stuck worker is killed, poll() starts a new one
+			return 'error', f'no cartoon after {timeout}s (stuck at {stage})'
+		height, width = win.getmaxyx()
+		text = f"{stage}... {spinner[tick % len(spinner)]}"
+		win.move(6, 1)
+		win.clrtoeol()
+		win.addstr(6, max(2, width//2 - len(text)//2), text, curses.color_pair(2))
+		win.attron(curses.color_pair(4))
+		win.border()
+		win.attroff(curses.color_pair(4))
+		win.refresh()
+		tick += 1
+		time.sleep(0.1)
 
 def spool_text(win, text, colr_pr, disp_row, delay=0.1):
 	""" spool_text prints characters to the screen one at a time """
@@ -854,6 +844,8 @@ if __name__ == "__main__":
 			wrapper(main)
 	except KeyboardInterrupt:
 		print('exiting')
+		worker.close()
+		smtp_pool.close()
 		button.close()
 		camera.close()
 
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+""" work buffers allocated once and handed to OpenCV/numpy as dst=/out=, plus peak memory readings """
+
+import numpy as np
+
+class BufferArena:
+	""" named buffers, one per (name, shape, dtype), so the preview and the full photo each keep their own """
+	def __init__(self):
+		self.buffers = {}
+
+	def get(self, name, shape, dtype=np.uint8):
+		key = (name, tuple(shape), np.dtype(dtype))
+		if key not in self.buffers:
+			self.buffers[key] = np.empty(shape, dtype=dtype)
+		return self.buffers[key]
+
+	def nbytes(self):
+		return sum(buffer.nbytes for buffer in self.buffers.values())
+
+def scratch(arena, name, shape, dtype=np.uint8):
+	""" a buffer from the arena, or a fresh one when running without an arena """
+	if arena is None:
+		return np.empty(shape, dtype=dtype)
+	return arena.get(name, shape, dtype)
+
+def peak_rss():
+	""" highest resident memory of this process since the last reset_peak_rss, in bytes (0 if unknown) """
+	try:
+		with open('/proc/self/status') as f:
+			for line in f:
+				if line.startswith('VmHWM:'):
+					return int(line.split()[1]) * 1024
+	except OSError:
+		pass
+	return 0
+
+def reset_peak_rss():
+	""" starts a new high-water mark, so peak_rss covers one session """
+	try:
+		with open('/proc/self/clear_refs', 'w') as f:
+			f.write('5')
+	except OSError:
+		pass
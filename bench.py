@@ -0,0 +1,799 @@
+#!/usr/bin/env python3
+""" bench.py times pieces of the cartoon pipeline without the Pi hardware
+
+	python3 bench.py quantize --image /home/pi1/photos/some_photo.jpg
+	python3 bench.py quantize --size 1920x1080 --repeat 5
+	python3 bench.py fused --size 3280x2464
+	python3 bench.py faces /home/pi1/photos/*.jpg
+	python3 bench.py track /home/pi1/photos/*.jpg
+	python3 bench.py mail --messages 30 --latency 0.05
+	python3 bench.py stages --size 3280x2464
+	python3 bench.py styles kmeans bilateral
+	python3 bench.py smoothing --size 3280x2464
+	python3 bench.py edges --image /home/pi1/photos/some_photo.jpg
+	python3 bench.py facesmooth --faces 1 4 8
+	python3 bench.py compose --frame /home/pi1/Pink_Comic_CFE_Final_2.png
+	python3 bench.py memory --size 3280x2464 --sessions 5
+	python3 bench.py tiled --size 3280x2464
+	python3 bench.py suite --save baseline.json
+	python3 bench.py suite /home/pi1/photos/*.jpg --baseline baseline.json
+"""
+
+import os
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import threading
+import smtplib
+import socketserver
+from email.mime.text import MIMEText
+
+import cv2
+import numpy as np
+
+from quantize import kmeans_full, kmeans_sampled, kmeans_warm, lut_quantize, PaletteCache
+from cartoon import CartoonKernel, FaceLayer, TOP_PAD, BOTTOM_PAD
+from frames import FrameAsset, FrameCache, Compositor, blend_into, COVERAGE_TILE
+from faces import FaceDetector, FaceTracker
+from mailer import Outbox, SMTPPool, smtp_send, NOOP_AFTER
+from stages import make_pool
+from smoothing import SMOOTHING_BACKENDS
+from edges import find_edges
+from styles import smooth
+
+def synthetic_photo(width, height, seed=0):
+	""" smooth colour gradients, a few blobs and sensor noise, close enough to a booth photo """
+	rng = np.random.default_rng(seed)
+	ys, xs = np.mgrid[0:height, 0:width].astype(np.float32)
+	image = np.empty((height, width, 3), dtype=np.float32)
+	for c in range(3):
+		fx, fy = rng.uniform(0.5, 3.0, 2)
+		image[:, :, c] = 128 + 90 * np.sin(fx * xs / width * np.pi + c) * np.cos(fy * ys / height * np.pi)
+	for _ in range(12):
+		center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+		axes = (int(rng.integers(width // 20, width // 5)), int(rng.integers(height // 20, height // 5)))
+		colour = [float(v) for v in rng.integers(0, 256, 3)]
+		cv2.ellipse(image, center, axes, float(rng.uniform(0, 180)), 0, 360, colour, -1)
+	image += rng.normal(0, 6, image.shape).astype(np.float32)
+	return np.uint8(np.clip(image, 0, 255))
+
+def synthetic_frame(width, height, top=280, bottom=200, seed=1):
+	""" opaque artwork all round, a clear window with a feathered edge where the photo goes """
+	frame = np.empty((height, width, 4), dtype=np.uint8)
+	frame[:, :, :3] = synthetic_photo(width, height, seed)
+	alpha = np.full((height, width), 255, dtype=np.uint8)
+	cv2.rectangle(alpha, (width // 20, top + height // 30), (width - width // 20, height - bottom - height // 30), 0, -1)
+	frame[:, :, 3] = cv2.GaussianBlur(alpha, (31, 31), 0)
+	return frame
+
+def load_image(args):
+	if args.image:
+		image = cv2.imread(args.image)
+		if image is None:
+			raise SystemExit(f"Could not read {args.image}")
+		return image
+	width, height = (int(v) for v in args.size.split('x'))
+	return synthetic_photo(width, height)
+
+def timed(func, repeat):
+	""" runs func repeat times, returns (best seconds, last result) """
+	best = float('inf')
+	for _ in range(repeat):
+		start = time.perf_counter()
+		result = func()
+		best = min(best, time.perf_counter() - start)
+	return best, result
+
+def colour_error(a, b):
+	""" mean absolute difference per channel, in 0-255 levels """
+	return float(np.mean(cv2.absdiff(a, b)))
+
+def bench_quantize(image, args):
+	cv2.setRNGSeed(0)
+	full_time, full_img = timed(lambda: kmeans_full(image), args.repeat)
+	settings = {'sample_size': args.sample_size, 'attempts': args.attempts, 'iterations': args.iterations}
+	sampled_time, sampled_img = timed(lambda: kmeans_sampled(image, **settings), args.repeat)
+	print(f"image {image.shape[1]}x{image.shape[0]}, best of {args.repeat}")
+	print(f"{'mode':10} {'seconds':>9} {'err vs src':>11} {'err vs full':>12}")
+	print(f"{'full':10} {full_time:9.3f} {colour_error(full_img, image):11.2f} {0.0:12.2f}")
+	print(f"{'sampled':10} {sampled_time:9.3f} {colour_error(sampled_img, image):11.2f} {colour_error(sampled_img, full_img):12.2f}")
+	lut_time, lut_img = timed(lambda: lut_quantize(image, sample_size=args.sample_size), args.repeat)
+	print(f"{'lut':10} {lut_time:9.3f} {colour_error(lut_img, image):11.2f} {colour_error(lut_img, full_img):12.2f}")
+	print(f"sampled saved {full_time - sampled_time:.3f}s ({full_time / sampled_time:.1f}x faster)")
+
+	# warm start: first session solves from scratch, later ones under the same lighting refine
+	with tempfile.TemporaryDirectory() as tmp:
+		cache = PaletteCache(os.path.join(tmp, 'palette_cache.npz'))
+		cold_time, _ = timed(lambda: kmeans_warm(image, cache, sample_size=args.sample_size), 1)
+		rng = np.random.default_rng(1)
+		next_photo = cv2.add(image, rng.integers(0, 8, image.shape, dtype=np.uint8))
+		warm_time, warm_img = timed(lambda: kmeans_warm(next_photo, cache, sample_size=args.sample_size), args.repeat)
+	print(f"{'warm':10} {warm_time:9.3f} {colour_error(warm_img, next_photo):11.2f}   (cold first session {cold_time:.3f}s)")
+
+def cartoon_inputs(image):
+	""" quantized image, edge mask and a stand-in smoothed face, as process_image has them """
+	quantized_img = lut_quantize(image)
+	gray = cv2.medianBlur(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), 7)
+	edges = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 9, 5)
+	face_image = cv2.convertScaleAbs(cv2.GaussianBlur(image, (41, 41), 0), alpha=0.8, beta=-10)
+	return quantized_img, edges, face_image
+
+def full_layer(face_image):
+	return FaceLayer(0, [(0, 0, face_image)])
+
+def cartoon_chain(quantized_img, edges, face_image):
+	""" the step-by-step version process_image used before CartoonKernel """
+	cartoon_background = cv2.bitwise_and(quantized_img, quantized_img, mask=edges)
+	final_image = cv2.addWeighted(cartoon_background, 1, face_image, 0.2, 0)
+	final_image = cv2.convertScaleAbs(final_image, alpha=1.3, beta=30)
+	return cv2.copyMakeBorder(final_image, 280, 200, 0, 0, cv2.BORDER_CONSTANT, value=[255, 255, 255])
+
+def full_frame_smooth(image, faces):
+	""" the smooth() process_image used before FaceLayer: 3-channel mask and blur over the whole photo """
+	mask = np.zeros_like(image, dtype=np.uint8)
+	for (x, y, w, h) in faces:
+		cv2.ellipse(mask, (int(x + w // 2), int(y + h // 2)), (int(w // 2), int(h // 2)), 0, 0, 360, (255, 255, 255), -1)
+	mask = cv2.GaussianBlur(mask, (41, 41), 0)
+	return cv2.convertScaleAbs(cv2.bitwise_and(image, mask), alpha=0.8, beta=-10)
+
+def bench_facesmooth(image, args):
+	height, width = image.shape[:2]
+	side = height // 4
+	print(f"image {width}x{height}, faces {side}px, best of {args.repeat}")
+	print(f"{'faces':>5} {'full frame':>11} {'face boxes':>11}")
+	for count in args.faces:
+		# a row of faces across the middle, like a group shot
+		faces = np.array([[int((i + 0.5) * width / count - side / 2), height // 3, side, side] for i in range(count)])
+		full_time, _ = timed(lambda: full_frame_smooth(image, faces), args.repeat)
+		roi_time, _ = timed(lambda: smooth(image, faces), args.repeat)
+		print(f"{count:5d} {full_time:11.4f} {roi_time:11.4f}")
+
+def original_add_frame(background, foreground):
+	""" the float add_frame from DratsX3, padded photo in, BGRA out """
+	background = cv2.cvtColor(background, cv2.COLOR_BGR2BGRA)
+	background[:, :, 3] = 255
+	alpha_background = background[:, :, 3] / 255.0
+	alpha_foreground = foreground[:, :, 3] / 255.0
+	for color in range(0, 3):
+		background[:, :, color] = alpha_foreground * foreground[:, :, color] + \
+			alpha_background * background[:, :, color] * (1 - alpha_foreground)
+	background[:, :, 3] = (1 - (1 - alpha_foreground) * (1 - alpha_background)) * 255
+	return background
+
+def whole_canvas_blend(padded, frame, colour, work):
+	""" the uint16 compositor before the coverage index: every pixel of the padded canvas """
+	blend_into(colour, padded, frame.premultiplied, frame.inverse_alpha, work)
+	return colour
+
+def bench_compose(image, args):
+	if args.frame:
+		foreground = cv2.imread(args.frame, cv2.IMREAD_UNCHANGED)
+		if foreground is None or foreground.shape[2] != 4:
+			raise SystemExit(f"Could not read {args.frame} as a BGRA PNG")
+	else:
+		foreground = synthetic_frame(image.shape[1], image.shape[0] + TOP_PAD + BOTTOM_PAD)
+	frame = FrameAsset(foreground)
+	height, width = frame.shape
+	photo = cv2.resize(image, (width, height - TOP_PAD - BOTTOM_PAD), interpolation=cv2.INTER_AREA)
+	padded = cv2.copyMakeBorder(photo, TOP_PAD, BOTTOM_PAD, 0, 0, cv2.BORDER_CONSTANT, value=[255, 255, 255])
+	colour = np.empty((height, width, 4), dtype=np.uint8)[:, :, :3]  # BGRA canvas like the compositor's
+	work = np.empty((height, width, 3), dtype=np.uint16)
+	compositor = Compositor(args.tile)
+	paths = [
+		('original loop', lambda: original_add_frame(padded, foreground)),
+		('whole canvas', lambda: whole_canvas_blend(padded, frame, colour, work)),
+		('coverage index', lambda: compositor.blend(photo, frame)),
+	]
+	print(f"frame {width}x{height}, {args.tile}px tiles, best of {args.repeat}")
+	results = {}
+	for label, compose in paths:
+		seconds, results[label] = timed(compose, args.repeat)
+		print(f"{label:16} {seconds:9.4f}s")
+	_, clear, partial = compositor.canvases[(frame, TOP_PAD, BOTTOM_PAD)]
+	window = (height - TOP_PAD - BOTTOM_PAD) * width
+	clear_px = sum((y1 - y0) * (x1 - x0) for y0, y1, x0, x1 in clear)
+	partial_px = sum((y1 - y0) * (x1 - x0) for (y0, y1, x0, x1), _ in partial)
+	print(f"photo window: {clear_px / window * 100:.1f}% copied in {len(clear)} spans, "
+		f"{partial_px / window * 100:.1f}% blended in {len(partial)} spans, the rest is opaque frame")
+	print(f"identical to whole canvas: {np.array_equal(results['coverage index'][:, :, :3], results['whole canvas'])}")
+
+def bench_fused(image, args):
+	inputs = cartoon_inputs(image)
+	kernel = CartoonKernel()
+	chain_time, chain_img = timed(lambda: cartoon_chain(*inputs), args.repeat)
+	quantized_img, edges, face_image = inputs
+	fused_time, fused_img = timed(lambda: kernel.render(quantized_img, edges, full_layer(face_image)), args.repeat)
+	height, width = image.shape[:2]
+	pixels = height * width
+	padded = (height + 280 + 200) * width
+	# bytes read + written per step, 3 bytes per BGR pixel and 1 per mask pixel
+	chain_traffic = 7 * pixels + 9 * pixels + 6 * pixels + 3 * pixels + 3 * padded
+	fused_traffic = 6 * pixels + 10 * pixels + 6 * pixels
+	print(f"image {width}x{height}, best of {args.repeat}")
+	print(f"{'path':8} {'seconds':>9} {'MB moved':>9} {'new buffers':>12}")
+	print(f"{'chain':8} {chain_time:9.4f} {chain_traffic / 1e6:9.1f} {4:12d}")
+	print(f"{'fused':8} {fused_time:9.4f} {fused_traffic / 1e6:9.1f} {0:12d}")
+	print(f"identical output: {np.array_equal(chain_img, fused_img)}")
+
+def overlap(a, b):
+	""" intersection over union of two (x, y, w, h) boxes """
+	x0, y0 = max(a[0], b[0]), max(a[1], b[1])
+	x1, y1 = min(a[0] + a[2], b[0] + b[2]), min(a[1] + a[3], b[1] + b[3])
+	inter = max(0, x1 - x0) * max(0, y1 - y0)
+	return inter / float(a[2] * a[3] + b[2] * b[3] - inter)
+
+def bench_faces(image, args):
+	cascade = cv2.CascadeClassifier(args.cascade)
+	if cascade.empty():
+		raise SystemExit(f"Could not load cascade {args.cascade}")
+	full = FaceDetector(cascade, mode='full')
+	fast = FaceDetector(cascade, mode='fast')
+	photos = [(path, cv2.imread(path)) for path in args.photos] or [('synthetic', image)]
+	full_total = fast_total = 0.0
+	found = missed = 0
+	print(f"{'photo':40} {'full s':>8} {'fast s':>8} {'faces':>6} {'kept':>5}")
+	for path, photo in photos:
+		gray = cv2.cvtColor(photo, cv2.COLOR_BGR2GRAY)
+		full_time, reference = timed(lambda: full.detect(photo, gray), args.repeat)
+		fast_time, faces = timed(lambda: fast.detect(photo, gray), args.repeat)
+		# the full search is the reference, a face counts as kept if a fast box overlaps it by half
+		kept = sum(1 for ref in reference if any(overlap(ref, box) >= 0.5 for box in faces))
+		found += kept
+		missed += len(reference) - kept
+		full_total += full_time
+		fast_total += fast_time
+		print(f"{path[-40:]:40} {full_time:8.3f} {fast_time:8.3f} {len(reference):6d} {kept:5d}")
+	recall = f"{found / (found + missed):.2f}" if found + missed else "n/a (no reference faces)"
+	print(f"total full {full_total:.3f}s, fast {fast_total:.3f}s, recall {recall}")
+
+class FakeCamera:
+	""" stands in for Picamera2, replaying photos on the main and YUV420 lores streams """
+	def __init__(self, frames, lores_size=(320, 240), fps=30):
+		self.frames = frames
+		self.index = 0
+		self.fps = fps
+		height, width = frames[0].shape[:2]
+		self.camera_config = {'main': {'size': (width, height)}, 'lores': {'size': lores_size}}
+
+	def capture_array(self, stream='main'):
+		time.sleep(1.0 / self.fps)  # wait for the next sensor frame like the real camera does
+		frame = self.frames[self.index % len(self.frames)]
+		self.index += 1
+		if stream == 'lores':
+			small = cv2.resize(frame, self.camera_config['lores']['size'], interpolation=cv2.INTER_AREA)
+			return cv2.cvtColor(small, cv2.COLOR_BGR2YUV_I420)
+		return frame
+
+class BoxDetector:
+	""" stands in for FaceDetector in the tracker checks: the bounding box of every white patch """
+	def detect(self, image, gray):
+		_, mask = cv2.threshold(gray, 128, 255, cv2.THRESH_BINARY)  # white is 235 on a YUV lores stream
+		contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+		return np.array([cv2.boundingRect(contour) for contour in contours], dtype=np.int32).reshape((-1, 4))
+
+def tracked_boxes(frames, lores_size):
+	""" FaceTracker on a fake camera replaying frames until it has seen a few of them, returns stop() """
+	tracker = FaceTracker(FakeCamera(frames, lores_size, fps=200), BoxDetector(), interval=0)
+	tracker.start()
+	while tracker.frames < 2 * len(frames):
+		time.sleep(0.01)
+	return tracker.stop()
+
+def check_tracker(width=1280, height=720, lores_size=(320, 240)):
+	""" asserts FaceTracker.stop() maps lores boxes back to main-stream coordinates, and None without a face """
+	box = (400, 180, 200, 260)  # x, y, w, h on the main stream
+	blank = np.zeros((height, width, 3), dtype=np.uint8)
+	face = blank.copy()
+	cv2.rectangle(face, box[:2], (box[0] + box[2] - 1, box[1] + box[3] - 1), (255, 255, 255), -1)
+	assert tracked_boxes([blank], lores_size) is None, "tracker found a face on a blank frame"
+	# one lores pixel either way, x and y scale differently (16:9 main, 4:3 lores)
+	tolerance = np.array([width / lores_size[0], height / lores_size[1]] * 2)
+	# the face on every frame, then on every other one (blinks keep the last boxes)
+	for frames in ([face], [face, blank]):
+		faces = tracked_boxes(frames, lores_size)
+		assert faces is not None and faces.shape == (1, 4), f"expected one box, got {faces}"
+		assert (np.abs(faces[0] - box) <= tolerance).all(), f"box {faces[0].tolist()} should be near {list(box)}"
+	print(f"tracker checks passed: lores {lores_size[0]}x{lores_size[1]} boxes land on the {width}x{height} main stream")
+
+def bench_track(image, args):
+	check_tracker()
+	cascade = cv2.CascadeClassifier(args.cascade)
+	if cascade.empty():
+		raise SystemExit(f"Could not load cascade {args.cascade}")
+	frames = [cv2.imread(path) for path in args.photos] or [image]
+	camera = FakeCamera(frames)
+	tracker = FaceTracker(camera, FaceDetector(cascade, mode='fast'))
+	tracker.start()
+	time.sleep(args.countdown)
+	start = time.perf_counter()
+	faces = tracker.stop()
+	stop_time = time.perf_counter() - start
+	full = FaceDetector(cascade, mode='full')
+	full_time, reference = timed(lambda: full.detect(frames[-1]), 1)
+	print(f"tracked {tracker.frames} lores frames in {args.countdown:.1f}s")
+	print(f"boxes from tracker: {None if faces is None else faces.tolist()}")
+	print(f"boxes from full search: {reference.tolist()}")
+	print(f"after capture: tracker {stop_time:.3f}s vs full search {full_time:.3f}s")
+
+class SlowSMTPHandler(socketserver.StreamRequestHandler):
+	""" just enough SMTP to accept mail, every reply waits `latency`, greeting and login wait `handshake`;
+		the server's drop_after_data, noop_reply and refuse stand in for a flaky or picky server """
+	def reply(self, text, delay=None):
+		time.sleep(self.server.latency if delay is None else delay)
+		self.wfile.write(text.encode() + b'\r\n')
+
+	def handle(self):
+		with self.server.lock:
+			self.server.connections += 1
+		self.reply('220 stand-in ready', self.server.handshake)
+		while True:
+			line = self.rfile.readline()
+			if not line:
+				return
+			command = line.decode(errors='replace').strip().upper()
+			if command.startswith('EHLO'):
+				self.reply('250-stand-in\r\n250 AUTH PLAIN LOGIN')
+			elif command.startswith('AUTH'):
+				self.reply('235 ok', self.server.handshake)
+			elif command.startswith('DATA'):
+				self.reply('354 go ahead')
+				while self.rfile.readline() not in (b'.\r\n', b''):
+					pass
+				with self.server.lock:
+					self.server.received += 1
+				self.reply('250 queued')
+				if self.server.drop_after_data:  # like a server timing out an idle connection
+					return
+			elif command.startswith('RCPT') and self.server.refuse and self.server.refuse.upper() in command:
+				self.reply(f'{self.server.refuse_code} refused')
+			elif command.startswith('NOOP') and self.server.noop_reply:
+				self.reply(self.server.noop_reply)
+			elif command.startswith('QUIT'):
+				self.reply('221 bye')
+				return
+			else:  # MAIL, RCPT, NOOP, RSET
+				self.reply('250 ok')
+
+class SlowSMTPServer(socketserver.ThreadingTCPServer):
+	daemon_threads = True
+	allow_reuse_address = True
+
+	def __init__(self, latency, handshake):
+		super().__init__(('127.0.0.1', 0), SlowSMTPHandler)
+		self.latency = latency
+		self.handshake = handshake
+		self.received = 0
+		self.connections = 0
+		self.drop_after_data = False  # close the connection after every accepted email
+		self.noop_reply = None        # e.g. '421 closing', instead of 250 to NOOP
+		self.refuse = None            # RCPT of addresses containing this gets refuse_code
+		self.refuse_code = 550        # 450 for greylisting
+		self.lock = threading.Lock()
+
+def check_pool():
+	""" asserts SMTPPool and Outbox keep the right connections against a refusing, dropping or stale server """
+	server = SlowSMTPServer(0, 0)
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	creds = {'email': 'booth@example.com', 'password': 'secret'}
+
+	def message(to='student@example.com'):
+		msg = MIMEText('photo')
+		msg['From'], msg['To'], msg['Subject'] = creds['email'], to, 'Hello from PCAS!'
+		return msg
+
+	def run(sends, noop_after=NOOP_AFTER, **mode):
+		""" sends on a fresh pool of one with the server in mode, returns (new connections, emails taken, idle) """
+		for name, value in mode.items():
+			setattr(server, name, value)
+		connections, received = server.connections, server.received
+		pool = SMTPPool(creds, size=1, server='127.0.0.1', port=server.server_address[1], tls=False, noop_after=noop_after)
+		for to in sends:
+			try:
+				pool.send(message(to))
+			except smtplib.SMTPRecipientsRefused:
+				pass
+		idle = pool.idle.qsize()
+		pool.close()
+		server.drop_after_data, server.noop_reply, server.refuse, server.refuse_code = False, None, None, 550
+		return server.connections - connections, server.received - received, idle
+
+	good = 'student@example.com'
+	# 550 on RCPT: the session is reset and the same connection carries on
+	assert run([good, 'refused@example.com', good], refuse='refused@') == (1, 2, 1), "refused email cost a connection"
+	# the server dropped the pooled connection after the last email: reconnect once, the email still goes out
+	assert run([good, good], drop_after_data=True) == (2, 2, 1), "dropped idle connection wasn't replaced"
+	# NOOP answered with an error: the stale connection is closed and a new one logs in
+	assert run([good, good], noop_after=0, noop_reply='421 closing') == (2, 2, 1), "connection failing NOOP was reused"
+	# the outbox moves a 550-refused email to failed/, keeps a 450 (greylisted) one for a retry,
+	# and delivers the rest on the pooled connection
+	server.refuse = 'refused@'
+	pool = SMTPPool(creds, size=1, server='127.0.0.1', port=server.server_address[1], tls=False)
+	for code, left in ((550, (0, 1)), (450, (1, 0))):
+		server.refuse_code = code
+		with tempfile.TemporaryDirectory() as tmp:
+			outbox = Outbox(pool.send, tmp)
+			for to in (good, 'refused@example.com', good):
+				outbox.enqueue(message(to))
+			outbox.drain()
+			assert (len(outbox.pending()), len(outbox.failed())) == left, \
+				f"{code} refusal left {len(outbox.pending())} pending, {len(outbox.failed())} failed, expected {left}"
+		assert pool.idle.qsize() == 1, "outbox lost its pooled connection"
+	pool.close()
+	server.shutdown()
+	print("pool checks passed: refused and greylisted RCPT, dropped connection and failed NOOP")
+
+def bench_mail(image, args):
+	check_pool()
+	server = SlowSMTPServer(args.latency, args.handshake)
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	port = server.server_address[1]
+	creds = {'email': 'booth@example.com', 'password': 'secret'}
+	_, jpeg = cv2.imencode('.jpg', image)
+	print(f"{args.messages} emails, {args.latency * 1000:.0f}ms per reply, {args.handshake * 1000:.0f}ms for greeting and login")
+	pool = SMTPPool(creds, size=args.pool, port=port, server='127.0.0.1', tls=False)
+	transports = [
+		('connect per email', 1, lambda msg: smtp_send(msg, creds, server='127.0.0.1', port=port, tls=False)),
+		(f'pool of {args.pool}', args.pool, pool.send),
+	]
+	for label, senders, send in transports:
+		with tempfile.TemporaryDirectory() as tmp:
+			outbox = Outbox(send, tmp, senders=senders)
+			for i in range(args.messages):
+				msg = MIMEText(f'photo {i} ' + 'x' * (len(jpeg) // 100))
+				msg['From'], msg['To'], msg['Subject'] = creds['email'], 'student@example.com', 'Hello from PCAS!'
+				outbox.enqueue(msg)
+			start = time.perf_counter()
+			outbox.drain()
+			seconds = time.perf_counter() - start
+			left = len(outbox.pending())
+		print(f"{label:20} {seconds:7.2f}s {60 * (args.messages - left) / seconds:8.1f} emails/min ({left} left)")
+	pool.close()
+	server.shutdown()
+
+def bench_stages(image, args):
+	import pipeline
+	no_faces = np.zeros((0, 4), dtype=np.int32)
+	print(f"image {image.shape[1]}x{image.shape[0]}, quantize mode {pipeline.QUANTIZE_MODE}, best of {args.repeat}")
+	with tempfile.TemporaryDirectory() as tmp:
+		pipeline.palette_cache.path = os.path.join(tmp, 'palette_cache.npz')
+		for label, threads in (('one stage at a time', 1), (f'{args.threads} threads', args.threads)):
+			pipeline.stage_pool = make_pool(threads)
+			seconds, _ = timed(lambda: pipeline.cartoonize(image, no_faces, None, pipeline.no_progress), args.repeat)
+			stages = '  '.join(f"{name} {t * 1000:.0f}ms" for name, t in pipeline.stage_timings.items())
+			print(f"{label:20} {seconds:7.3f}s   {stages}")
+			pipeline.stage_pool.shutdown()
+
+def bench_styles(image, args):
+	import pipeline
+	from styles import STYLES
+	no_faces = np.zeros((0, 4), dtype=np.int32)
+	print(f"image {image.shape[1]}x{image.shape[0]}, best of {args.repeat}")
+	with tempfile.TemporaryDirectory() as tmp:
+		pipeline.palette_cache.path = os.path.join(tmp, 'palette_cache.npz')
+		for name in args.styles or STYLES:
+			seconds, _ = timed(lambda: pipeline.cartoonize(image, no_faces, None, pipeline.no_progress, style=name), args.repeat)
+			stages = '  '.join(f"{stage} {t * 1000:.0f}ms" for stage, t in pipeline.stage_timings.items())
+			print(f"{name:12} {seconds:7.3f}s   {stages}")
+
+def bench_smoothing(image, args):
+	reference_time, reference = timed(lambda: SMOOTHING_BACKENDS['bilateral'](image), args.repeat)
+	print(f"image {image.shape[1]}x{image.shape[0]}, best of {args.repeat}, compared with bilateralFilter(9, 250, 250)")
+	print(f"{'backend':16} {'seconds':>9} {'speedup':>8} {'PSNR dB':>8} {'mean err':>9}")
+	print(f"{'bilateral':16} {reference_time:9.3f} {1:8.1f} {'-':>8} {'-':>9}")
+	for name, backend in SMOOTHING_BACKENDS.items():
+		if name == 'bilateral':
+			continue
+		seconds, smoothed = timed(lambda: backend(image), args.repeat)
+		print(f"{name:16} {seconds:9.3f} {reference_time / seconds:8.1f} {cv2.PSNR(reference, smoothed):8.2f} "
+			f"{colour_error(smoothed, reference):9.2f}")
+	# how far the unfiltered photo is, anything closer than this is doing the bilateral's job
+	print(f"{'(no smoothing)':16} {0:9.3f} {'-':>8} {cv2.PSNR(reference, image):8.2f} {colour_error(image, reference):9.2f}")
+
+def bench_edges(image, args):
+	from pipeline import EDGE_SETTINGS
+	gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+	reference = find_edges(gray, 'adaptive', **EDGE_SETTINGS['adaptive']) == 0
+	print(f"image {image.shape[1]}x{image.shape[0]}, best of {args.repeat}, settings from pipeline.EDGE_SETTINGS")
+	print(f"{'backend':12} {'ms/frame':>9} {'line px':>8} {'shared w/ adaptive':>19}")
+	for name, settings in EDGE_SETTINGS.items():
+		seconds, mask = timed(lambda: find_edges(gray, name, **settings), args.repeat)
+		lines = mask == 0
+		# line pixels both masks agree on, over line pixels in either
+		shared = np.count_nonzero(lines & reference) / max(1, np.count_nonzero(lines | reference))
+		print(f"{name:12} {seconds * 1000:9.1f} {np.mean(lines) * 100:7.2f}% {shared * 100:18.1f}%")
+
+def memory_sessions(image, use_arena, sessions, tiled, results):
+	""" runs in a forked child so each setting starts from the same memory, puts [(seconds, peak RSS)] """
+	import pipeline
+	from arena import BufferArena, peak_rss, reset_peak_rss
+	from tiles import framed_strips
+	from styles import get_style
+	pipeline.arena = BufferArena() if use_arena else None
+	frame = FrameAsset(synthetic_frame(image.shape[1], image.shape[0] + TOP_PAD + BOTTOM_PAD))
+	style = get_style(pipeline.STYLE)
+	no_faces = np.zeros((0, 4), dtype=np.int32)
+	runs = []
+	with tempfile.TemporaryDirectory() as tmp:
+		pipeline.palette_cache.path = os.path.join(tmp, 'palette_cache.npz')
+		os.makedirs(os.path.join(tmp, 'photos_cartoon'))
+		for session in range(sessions):
+			reset_peak_rss()
+			start = time.perf_counter()
+			if tiled:  # pipeline.framed_cartoon_strips, with the synthetic frame instead of a frame file
+				rows = style.strip_rows(image, no_faces, None, None, pipeline.STYLE_SETTINGS.get(style.name, {}))
+				final = framed_strips(image.shape, rows[1], rows[2], rows[0], style.kernel(image.shape), frame,
+					pipeline.compositor, TOP_PAD, BOTTOM_PAD, pipeline.stage_pool, pipeline.STRIP_HEIGHT)
+			else:
+				cartoon = pipeline.cartoonize(image, no_faces, None, pipeline.no_progress)
+				final = pipeline.compositor.blend(cartoon, frame)
+			seconds = time.perf_counter() - start
+			pipeline.write_renditions(final, os.path.join(tmp, 'photos', f'{session}.jpg'), arena=pipeline.arena)
+			runs.append((seconds, peak_rss()))
+	results.put(runs)
+
+def in_child(target, *args):
+	""" target(*args, results) in a forked child, so each run starts from the same memory; returns what it put """
+	import multiprocessing
+	import pipeline  # frames and cascade loaded once, before the children fork
+	context = multiprocessing.get_context('fork')
+	results = context.Queue()
+	child = context.Process(target=target, args=args + (results,))
+	child.start()
+	result = results.get()
+	child.join()
+	return result
+
+def forked_sessions(image, sessions, use_arena=False, tiled=False):
+	""" memory_sessions in a fresh child process """
+	runs = in_child(memory_sessions, image, use_arena, sessions, tiled)
+	if not runs[0][1]:
+		raise SystemExit("No /proc/self/status here, peak RSS can't be read")
+	return runs
+
+def bench_memory(image, args):
+	import pipeline
+	pipeline.STYLE = args.style
+	print(f"image {image.shape[1]}x{image.shape[0]}, style {args.style}, peak RSS of each session in MB")
+	for label, use_arena in (('fresh arrays', False), ('buffer arena', True)):
+		runs = forked_sessions(image, args.sessions, use_arena)
+		print(f"{label:14} " + ' '.join(f"{peak / 1e6:6.0f}" for _, peak in runs))
+
+def bench_tiled(image, args):
+	import pipeline
+	pipeline.STYLE = args.style
+	pipeline.STRIP_HEIGHT = args.strip_height
+	print(f"image {image.shape[1]}x{image.shape[0]}, style {args.style}, cartoon + frame, "
+		f"best of {args.repeat} sessions")
+	print(f"{'mode':24} {'seconds':>8} {'peak MB':>8}")
+	for label, use_arena, tiled in (('whole photo', False, False), ('whole photo, arena', True, False),
+			(f'strips of {args.strip_height} rows', False, True)):
+		runs = forked_sessions(image, args.repeat, use_arena, tiled)
+		print(f"{label:24} {min(s for s, _ in runs):8.3f} {max(p for _, p in runs) / 1e6:8.0f}")
+
+SUITE_SIZES = ('640x480', '1920x1080', '3280x2464')  # preview-ish, HD, the v2 camera's full sensor
+SUITE_PERCENTILES = (50, 90, 99)
+SUITE_STAGES = ('gray', 'faces', 'smooth', 'edges', 'colour', 'render', 'prepare', 'strips', 'frame', 'write', 'total')
+
+def suite_run(frames, sessions, warmup, cascade, results):
+	""" one source at one size in a forked child: process_image on the fake camera's photos, every stage timed """
+	import pipeline
+	from arena import peak_rss, reset_peak_rss
+	tmp = tempfile.mkdtemp()
+	pipeline.palette_cache.path = os.path.join(tmp, 'palette_cache.npz')
+	pipeline.face_detector = FaceDetector(cascade, mode='fast')
+	height, width = frames[0].shape[:2]
+	frame_path = os.path.join(tmp, 'suite_frame.png')
+	cv2.imwrite(frame_path, synthetic_frame(width, height + TOP_PAD + BOTTOM_PAD))
+	pipeline.frame_cache = FrameCache({'Suite': frame_path})
+	camera = FakeCamera(frames, fps=1000)  # no waiting for the sensor, the capture isn't timed
+	os.makedirs(os.path.join(tmp, 'photos_cartoon'))
+	timings, peaks = {}, []
+	for session in range(warmup + sessions):
+		image = camera.capture_array('main')
+		reset_peak_rss()
+		# process_image one step at a time, so the frame and the files get their own times
+		start = time.perf_counter()
+		if pipeline.TILED:
+			final = pipeline.framed_cartoon_strips(image, None, None, 'Suite', pipeline.no_progress)
+			times = dict(pipeline.stage_timings)
+		else:
+			cartoon = pipeline.cartoonize(image, None, None, pipeline.no_progress)
+			times = dict(pipeline.stage_timings)
+			framed = time.perf_counter()
+			final = pipeline.add_frame(cartoon, 'Suite')
+			times['frame'] = time.perf_counter() - framed
+		written = time.perf_counter()
+		pipeline.write_renditions(final, os.path.join(tmp, 'photos', f'{session}.jpg'), arena=pipeline.arena)
+		times['write'] = time.perf_counter() - written
+		times['total'] = time.perf_counter() - start
+		if session >= warmup:  # the first photos allocate the arena and train the palette
+			for stage, seconds in times.items():
+				timings.setdefault(stage, []).append(seconds)
+			peaks.append(peak_rss())
+	shutil.rmtree(tmp)
+	results.put((timings, peaks))
+
+def latency_summary(seconds):
+	""" percentiles, mean and worst of one stage, in milliseconds """
+	ms = np.array(seconds) * 1000
+	summary = {f'p{p}': round(float(np.percentile(ms, p)), 2) for p in SUITE_PERCENTILES}
+	summary.update(mean=round(float(ms.mean()), 2), max=round(float(ms.max()), 2))
+	return summary
+
+def suite_regressions(report, baseline, tolerance, floor_ms=1.0):
+	""" (run, measure, baseline, now) for every p50 or peak memory that grew by more than tolerance;
+		p50s that moved by less than floor_ms are timer noise """
+	found = []
+	for run, result in report['runs'].items():
+		old = baseline['runs'].get(run)
+		if old is None:
+			continue
+		for stage, summary in result['stages'].items():
+			if stage in old['stages']:
+				before, now = old['stages'][stage]['p50'], summary['p50']
+				if now > before * (1 + tolerance) and now - before > floor_ms:
+					found.append((run, f'{stage} p50 ms', before, now))
+		before, now = old['peak_rss_mb'], result['peak_rss_mb']
+		if now > before * (1 + tolerance):
+			found.append((run, 'peak MB', before, now))
+	return found
+
+def print_suite(report, baseline):
+	percentiles = ' '.join(f"{f'p{p}':>8}" for p in SUITE_PERCENTILES)
+	for run, result in report['runs'].items():
+		old = baseline['runs'].get(run) if baseline else None
+		peak = f"peak {result['peak_rss_mb']:.0f} MB"
+		if old:
+			peak += f" (baseline {old['peak_rss_mb']:.0f})"
+		print(f"\n{run}, {peak}")
+		print(f"{'stage ms':10} {percentiles} {'max':>8}" + (f" {'base p50':>9} {'change':>7}" if old else ''))
+		order = sorted(result['stages'], key=lambda stage: SUITE_STAGES.index(stage) if stage in SUITE_STAGES else 0)
+		for stage in order:
+			summary = result['stages'][stage]
+			line = f"{stage:10} " + ' '.join(f"{summary[f'p{p}']:8.1f}" for p in SUITE_PERCENTILES) + f" {summary['max']:8.1f}"
+			if old and stage in old['stages']:
+				before = old['stages'][stage]['p50']
+				line += f" {before:9.1f} {(summary['p50'] / before - 1) * 100 if before else 0:+6.0f}%"
+			print(line)
+
+def bench_suite(image, args):
+	import pipeline
+	pipeline.STYLE = args.style
+	pipeline.EDGE_BACKEND = args.edges or pipeline.EDGE_BACKEND
+	pipeline.TILED = args.tiled
+	cascade = cv2.CascadeClassifier(args.cascade)
+	if cascade.empty():
+		raise SystemExit(f"Could not load cascade {args.cascade}")
+	paths = args.photos + ([args.image] if args.image else [])
+	recorded = [cv2.imread(path) for path in paths]
+	for path, photo in zip(paths, recorded):
+		if photo is None:
+			raise SystemExit(f"Could not read {path}")
+	baseline = None
+	if args.baseline:
+		with open(args.baseline) as f:
+			baseline = json.load(f)
+	report = {'settings': {
+		'style': args.style, 'edges': pipeline.EDGE_BACKEND, 'tiled': args.tiled, 'buffer_arena': pipeline.arena is not None,
+		'sessions': args.sessions, 'warmup': args.warmup, 'cpus': os.cpu_count(), 'machine': platform.machine(),
+		'opencv': cv2.__version__, 'numpy': np.__version__,
+	}, 'runs': {}}
+	if baseline and baseline['settings'] != report['settings']:
+		changed = sorted(key for key in report['settings'] if baseline['settings'].get(key) != report['settings'][key])
+		print(f"Baseline was run with different settings: {', '.join(changed)}")
+	for size in args.sizes:
+		width, height = (int(v) for v in size.split('x'))
+		sources = {'synthetic': [synthetic_photo(width, height)]}  # one scene, like a booth in one spot
+		if recorded:
+			sources['recorded'] = [cv2.resize(photo, (width, height), interpolation=cv2.INTER_AREA) for photo in recorded]
+		for source, frames in sources.items():
+			timings, peaks = in_child(suite_run, frames, args.sessions, args.warmup, cascade)
+			report['runs'][f'{source} {size}'] = {
+				'stages': {stage: latency_summary(seconds) for stage, seconds in timings.items()},
+				'peak_rss_mb': round(max(peaks) / 1e6, 1) if peaks[0] else None,
+			}
+	print(f"style {args.style}, {args.sessions} sessions per run after {args.warmup} warm-up")
+	print_suite(report, baseline)
+	if args.save:
+		with open(args.save, 'w') as f:
+			json.dump(report, f, indent=1)
+		print(f"\nsaved {args.save}")
+	if baseline:
+		regressions = suite_regressions(report, baseline, args.tolerance)
+		for run, measure, before, now in regressions:
+			print(f"SLOWER {run}: {measure} {before} -> {now}")
+		if regressions:
+			raise SystemExit(1)
+
+def main():
+	common = argparse.ArgumentParser(add_help=False)
+	common.add_argument('--image', help="photo to use instead of a synthetic one")
+	common.add_argument('--size', default='1920x1080', help="synthetic image size, WxH")
+	common.add_argument('--repeat', type=int, default=3)
+	parser = argparse.ArgumentParser(description="Benchmark the cartoon pipeline off the Pi")
+	sub = parser.add_subparsers(dest='bench', required=True)
+
+	q = sub.add_parser('quantize', parents=[common], help="full k-means vs sampled, warm-started and lookup-table quantizers")
+	q.add_argument('--sample-size', type=int, default=20000)
+	q.add_argument('--attempts', type=int, default=3)
+	q.add_argument('--iterations', type=int, default=20)
+	q.set_defaults(func=bench_quantize)
+
+	f = sub.add_parser('fused', parents=[common], help="step-by-step cartoon chain vs CartoonKernel")
+	f.set_defaults(func=bench_fused)
+
+	d = sub.add_parser('faces', parents=[common], help="full-frame vs downscaled central face detection")
+	d.add_argument('photos', nargs='*', help="recorded booth photos, recall is measured against the full search")
+	d.add_argument('--cascade', default=cv2.data.haarcascades + 'haarcascade_frontalface_default.xml' if hasattr(cv2, 'data')
+		else '/home/pi1/Downloads/haarcascade_frontalface_default.xml')
+	d.set_defaults(func=bench_faces)
+
+	t = sub.add_parser('track', parents=[common], help="face tracking on a fake camera's lores stream")
+	t.add_argument('photos', nargs='*', help="frames the fake camera replays")
+	t.add_argument('--countdown', type=float, default=2.0, help="seconds to track before the shutter")
+	t.add_argument('--cascade', default=d.get_default('cascade'))
+	t.set_defaults(func=bench_track)
+
+	m = sub.add_parser('mail', parents=[common], help="outbox drain speed against a slow local SMTP stand-in")
+	m.add_argument('--messages', type=int, default=30)
+	m.add_argument('--latency', type=float, default=0.05, help="seconds before each SMTP reply")
+	m.add_argument('--handshake', type=float, default=0.3, help="extra seconds for greeting and login, standing in for TLS")
+	m.add_argument('--pool', type=int, default=3)
+	m.set_defaults(func=bench_mail)
+
+	s = sub.add_parser('stages', parents=[common], help="cartoon stages one at a time vs side by side on the stage pool")
+	s.add_argument('--threads', type=int, default=4)
+	s.set_defaults(func=bench_stages)
+
+	y = sub.add_parser('styles', parents=[common], help="every registered cartoon style, whole cartoonize step")
+	y.add_argument('styles', nargs='*', help="style names, all of them if left out")
+	y.set_defaults(func=bench_styles)
+
+	o = sub.add_parser('smoothing', parents=[common], help="bilateralFilter vs the faster edge-preserving backends")
+	o.set_defaults(func=bench_smoothing)
+
+	e = sub.add_parser('edges', parents=[common], help="cost per frame of every outline backend")
+	e.set_defaults(func=bench_edges)
+
+	g = sub.add_parser('facesmooth', parents=[common], help="face softening over the whole photo vs only the face boxes")
+	g.add_argument('--faces', type=int, nargs='+', default=[1, 4, 8])
+	g.set_defaults(func=bench_facesmooth)
+
+	c = sub.add_parser('compose', parents=[common], help="frame compositing: original float loop, whole canvas, coverage index")
+	c.add_argument('--frame', help="comic frame PNG, a synthetic one if left out")
+	c.add_argument('--tile', type=int, default=COVERAGE_TILE)
+	c.set_defaults(func=bench_compose)
+
+	r = sub.add_parser('memory', parents=[common], help="peak RSS per session with and without the buffer arena")
+	r.add_argument('--sessions', type=int, default=5)
+	r.add_argument('--style', default='kmeans')
+	r.set_defaults(func=bench_memory)
+
+	t = sub.add_parser('tiled', parents=[common], help="whole-photo vs strip-tiled cartoon + frame, time and peak RSS")
+	t.add_argument('--style', default='kmeans')
+	t.add_argument('--strip-height', type=int, default=256)
+	t.set_defaults(func=bench_tiled)
+
+	u = sub.add_parser('suite', parents=[common], help="every stage at several sizes on a fake camera, percentiles and peak "
+		"memory as JSON, compared with a saved baseline")
+	u.add_argument('photos', nargs='*', help="recorded booth photos, run at each size next to the synthetic ones")
+	u.add_argument('--sizes', nargs='+', default=list(SUITE_SIZES))
+	u.add_argument('--sessions', type=int, default=20, help="timed photos per size")
+	u.add_argument('--warmup', type=int, default=2, help="untimed photos first")
+	u.add_argument('--style', default='kmeans')
+	u.add_argument('--edges', help="outline backend instead of the style's own")
+	u.add_argument('--tiled', action='store_true', help="strip-tiled mode, timed as prepare and strips")
+	u.add_argument('--cascade', default=d.get_default('cascade'))
+	u.add_argument('--save', help="write the report here as JSON")
+	u.add_argument('--baseline', help="report saved earlier, exits with 1 if a p50 or the peak memory got worse")
+	u.add_argument('--tolerance', type=float, default=0.10, help="allowed slowdown before it counts, 0.10 = 10%%")
+	u.set_defaults(func=bench_suite)
+
+	args = parser.parse_args()
+	args.func(load_image(args), args)
+
+if __name__ == "__main__":
+	main()
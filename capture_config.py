@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+
+from cartoon import TOP_PAD, BOTTOM_PAD
+
+LORES_WIDTH = 320   # face tracking stream, same shape as the photo
+
+def photo_size(frame_shape, top=TOP_PAD, bottom=BOTTOM_PAD):
+	""" (width, height) the camera has to deliver so photo + white bands == frame PNG """
+	frame_height, frame_width = frame_shape
+	return frame_width, frame_height - top - bottom
+
+def lores_size(size, width=LORES_WIDTH):
+	""" lores stream with the same aspect ratio as main, even sizes for YUV420 """
+	height = int(round(size[1] * width / size[0] / 2)) * 2
+	return width, height
+
+def pick_sensor_mode(sensor_modes, size):
+	""" smallest sensor mode that still covers size, so the ISP only ever scales down """
+	aspect = size[0] / size[1]
+	covering = [mode for mode in sensor_modes if mode['size'][0] >= size[0] and mode['size'][1] >= size[1]]
+	if not covering:  # sensor is smaller than the frame, take the biggest it has
+		return max(sensor_modes, key=lambda mode: mode['size'][0] * mode['size'][1])
+	# least field of view lost to cropping, then fewest pixels to read out
+	return min(covering, key=lambda mode: (abs(mode['size'][0] / mode['size'][1] - aspect) > 0.05,
+		mode['size'][0] * mode['size'][1]))
+
+def check_capture_size(configured, wanted):
+	""" startup check: the camera has to hand back exactly the photo window of the frame """
+	if tuple(configured) != tuple(wanted):
+		raise ValueError(f"Camera delivers {configured[0]}x{configured[1]} but the comic frame needs "
+			f"{wanted[0]}x{wanted[1]}, change the frame PNGs or TOP_PAD/BOTTOM_PAD")
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+import cv2
+import numpy as np
+
+#*#*# CHANGE ME *#*#*#
+TOP_PAD, BOTTOM_PAD = 280, 200   # white bands so the photo fits the comic frame
+FACE_WEIGHT = 0.2                # how much of the smoothed face is blended back in
+CONTRAST_ALPHA, CONTRAST_BETA = 1.3, 30
+
+def contrast_lut(alpha=CONTRAST_ALPHA, beta=CONTRAST_BETA):
+	""" 256-entry table for the contrast stretch """
+	levels = np.arange(256, dtype=np.uint8).reshape((1, 256))
+	# built with the same OpenCV call process_image used, so rounding matches exactly
+	return cv2.convertScaleAbs(levels, alpha=alpha, beta=beta)
+
+class FaceLayer:
+	""" smoothed faces as patches at (x, y), the rest of the photo is one flat level """
+	def __init__(self, background=0, patches=()):
+		self.background = background
+		self.patches = list(patches)
+
+class CartoonKernel:
+	""" edge mask, face blend and contrast in one chain, written straight into the padded canvas """
+	def __init__(self, face_weight=FACE_WEIGHT, alpha=CONTRAST_ALPHA, beta=CONTRAST_BETA, top=TOP_PAD, bottom=BOTTOM_PAD):
+		self.face_weight = face_weight
+		self.contrast_lut = contrast_lut(alpha, beta)
+		self.top, self.bottom = top, bottom
+		self.canvas = None
+		self.work = None
+
+	def _buffers(self, shape):
+		# white bands are painted once, only the photo window changes per call
+		if self.work is None or self.work.shape != shape:
+			height, width = shape[:2]
+			self.canvas = np.full((self.top + height + self.bottom, width, 3), 255, dtype=np.uint8)
+			self.work = np.empty(shape, dtype=np.uint8)
+		return self.canvas, self.work
+
+	def window(self):
+		""" the photo area of the padded canvas """
+		return self.canvas[self.top:self.top + self.work.shape[0]]
+
+	def render(self, quantized_img, edges, face_layer):
+		canvas, work = self._buffers(quantized_img.shape)
+		self.render_strip(quantized_img, edges, face_layer, work, self.window())
+		return canvas
+
+	def render_strip(self, quantized_img, edges, face_layer, work, out, row=0):
+		""" render for the photo rows starting at row, into out; work is a uint8 buffer the size of the strip """
+		# addWeighted(cartoon, 1, face, w, 0) == cartoon + round(w * face), and cartoon is 0 on edges
+		if face_layer is None:  # styles without a face blend
+			work[:] = 0
+		else:
+			# flat level everywhere, then only the face patches get the per-pixel blend
+			level = cv2.convertScaleAbs(np.uint8([[face_layer.background]]), alpha=self.face_weight)[0, 0]
+			work[:] = level
+			for x, y, patch in face_layer.patches:
+				# the part of the patch inside this strip
+				y0, y1 = max(y, row), min(y + patch.shape[0], row + work.shape[0])
+				if y0 < y1:
+					cv2.convertScaleAbs(patch[y0 - y:y1 - y], dst=work[y0 - row:y1 - row, x:x + patch.shape[1]],
+						alpha=self.face_weight)
+		cv2.add(quantized_img, work, dst=work, mask=edges)
+		# contrast stretch is the last step, so it writes the output directly
+		cv2.LUT(work, self.contrast_lut, dst=out)
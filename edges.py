@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+""" outline backends, each returns a mask that is 0 on the black lines and 255 everywhere else """
+
+import math
+import inspect
+import cv2
+import numpy as np
+
+from arena import scratch
+
+def adaptive(gray, median=7, block_size=9, c=5, arena=None):
+	""" the original: median blur then a mean adaptive threshold """
+	blurred = cv2.medianBlur(gray, median, dst=scratch(arena, 'edges_blurred', gray.shape))
+	return cv2.adaptiveThreshold(blurred, 255, cv2.ADAPTIVE_THRESH_MEAN_C,
+								  cv2.THRESH_BINARY, block_size, c, dst=scratch(arena, 'edges', gray.shape))
+
+def canny(gray, low=100, high=200, blur=5, thickness=2, arena=None):
+	""" thin lines on strong edges only, flat areas stay clean """
+	if blur:
+		gray = cv2.GaussianBlur(gray, (blur, blur), 0, dst=scratch(arena, 'edges_blurred', gray.shape))
+	lines = cv2.Canny(gray, low, high, edges=scratch(arena, 'edges_lines', gray.shape))
+	if thickness > 1:
+		lines = cv2.dilate(lines, np.ones((thickness, thickness), dtype=np.uint8),
+			dst=scratch(arena, 'edges_thick', gray.shape))
+	return cv2.bitwise_not(lines, dst=scratch(arena, 'edges', gray.shape))
+
+def dog(gray, sigma=1.0, k=1.6, tau=0.98, eps=-1.0, arena=None):
+	""" difference of Gaussians (XDoG with a hard threshold, the mask has to be black or white) """
+	levels = scratch(arena, 'edges_float', gray.shape, np.float32)
+	levels[:] = gray
+	narrow = cv2.GaussianBlur(levels, (0, 0), sigma, dst=scratch(arena, 'edges_narrow', gray.shape, np.float32))
+	wide = cv2.GaussianBlur(levels, (0, 0), sigma * k, dst=scratch(arena, 'edges_wide', gray.shape, np.float32))
+	# narrow - tau * wide is negative just inside the dark side of an edge
+	response = cv2.addWeighted(narrow, 1.0, wide, -tau, -eps, dst=narrow)
+	cv2.threshold(response, 0, 255, cv2.THRESH_BINARY, dst=response)
+	return cv2.convertScaleAbs(response, dst=scratch(arena, 'edges', gray.shape))
+
+def downscaled(gray, scale=0.5, inner='adaptive', arena=None, **settings):
+	""" any backend on a smaller copy, lines scaled back up and re-thresholded so they stay smooth """
+	height, width = gray.shape
+	size = (round(width * scale), round(height * scale))
+	small = cv2.resize(gray, size, dst=scratch(arena, 'edges_small', size[::-1]), interpolation=cv2.INTER_AREA)
+	mask = cv2.resize(EDGE_BACKENDS[inner](small, arena=arena, **settings), (width, height),
+		dst=scratch(arena, 'edges', gray.shape), interpolation=cv2.INTER_LINEAR)
+	cv2.threshold(mask, 127, 255, cv2.THRESH_BINARY, dst=mask)
+	return mask
+
+EDGE_BACKENDS = {
+	'adaptive': adaptive,
+	'canny': canny,
+	'dog': dog,
+	'downscaled': downscaled,
+}
+
+def edge_halo(backend='adaptive', **settings):
+	""" rows above and below a strip a backend has to see, so the strip's lines match the whole photo's """
+	defaults = inspect.signature(EDGE_BACKENDS[backend]).parameters
+	def setting(name):
+		return settings.get(name, defaults[name].default)
+	if backend == 'adaptive':
+		return setting('median') // 2 + setting('block_size') // 2
+	if backend == 'canny':
+		# hysteresis can follow a line further than this, a strip may lose the faint end of one
+		return setting('blur') // 2 + 1 + setting('thickness') + 8
+	if backend == 'dog':
+		return math.ceil(4 * setting('sigma') * setting('k')) + 1
+	inner_settings = {name: value for name, value in settings.items() if name not in ('scale', 'inner')}
+	return math.ceil((edge_halo(setting('inner'), **inner_settings) + 2) / setting('scale')) + 2
+
+def find_edges(gray, backend='adaptive', arena=None, **settings):
+	""" outlines for the cartoon, backend picks the method, arena supplies the output buffers """
+	return EDGE_BACKENDS[backend](gray, arena=arena, **settings)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+import threading
+import cv2
+import numpy as np
+
+#*#*# CHANGE ME *#*#*#
+DETECT_WIDTH = 640                     # full frame width is scaled down to this before searching
+SEARCH_REGION = (0.15, 0.0, 0.85, 1.0) # left, top, right, bottom of the search area, as fractions of the frame
+FACE_FRACTION = 0.25                   # expected face height as a fraction of the frame height
+FACE_RANGE = 0.4                       # smallest face searched is FACE_RANGE * expected, largest is expected / FACE_RANGE
+SCALE_FACTOR = 1.1
+TRACK_INTERVAL = 0.1                   # seconds between detections on the preview stream
+
+class FaceDetector:
+	""" Haar cascade face detection, 'full' like the original or 'fast' on a small central crop """
+	def __init__(self, cascade, mode='fast', detect_width=DETECT_WIDTH, region=SEARCH_REGION,
+			face_fraction=FACE_FRACTION, face_range=FACE_RANGE, scale_factor=SCALE_FACTOR):
+		self.cascade = cascade
+		self.mode = mode
+		self.detect_width = detect_width
+		self.region = region
+		self.face_fraction = face_fraction
+		self.face_range = face_range
+		self.scale_factor = scale_factor
+
+	def detect(self, image, gray=None):
+		""" returns (x, y, w, h) boxes in full-resolution coordinates """
+		if gray is None:
+			gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+		if self.mode == 'full':
+			return self.detect_full(gray)
+		return self.detect_fast(gray)
+
+	def detect_full(self, gray):
+		gray = cv2.equalizeHist(gray)
+		faces = self.cascade.detectMultiScale(gray, scaleFactor=1.05, minNeighbors=4,
+			minSize=(30, 30))
+		return np.array(faces, dtype=np.int32).reshape((-1, 4))
+
+	def detect_fast(self, gray):
+		height, width = gray.shape
+		left, top, right, bottom = self.region
+		x0, y0 = int(left * width), int(top * height)
+		x1, y1 = int(right * width), int(bottom * height)
+		scale = min(1.0, self.detect_width / width)
+		small = cv2.resize(gray[y0:y1, x0:x1], None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+		small = cv2.equalizeHist(small)
+
+		# only search the face sizes a person standing at the booth can have
+		expected = self.face_fraction * height * scale
+		min_side = max(24, int(expected * self.face_range))
+		max_side = max(min_side + 1, min(small.shape[0], small.shape[1], int(expected / self.face_range)))
+		faces = self.cascade.detectMultiScale(small, scaleFactor=self.scale_factor, minNeighbors=4,
+			minSize=(min_side, min_side), maxSize=(max_side, max_side))
+		faces = np.array(faces, dtype=np.float32).reshape((-1, 4))
+
+		# back to full-resolution coordinates
+		faces /= scale
+		faces[:, 0] += x0
+		faces[:, 1] += y0
+		return np.rint(faces).astype(np.int32)
+
+def lores_gray(frame, size):
+	""" grayscale from a lores capture; YUV420 comes back as one 2D array with the Y plane on top """
+	width, height = size
+	if frame.ndim == 2:
+		return frame[:height, :width]
+	return cv2.cvtColor(frame[:height, :width, :3], cv2.COLOR_BGR2GRAY)
+
+class FaceTracker:
+	""" keeps finding faces on the camera's low-res stream in a background thread (during the countdown) """
+	def __init__(self, camera, detector, interval=TRACK_INTERVAL):
+		self.camera = camera
+		self.detector = detector
+		self.interval = interval
+		self.faces = None
+		self.frames = 0
+		self._stop = threading.Event()
+		self._thread = None
+
+	def start(self):
+		self.faces = None
+		self.frames = 0
+		self._stop.clear()
+		self._thread = threading.Thread(target=self._track, daemon=True)
+		self._thread.start()
+
+	def _track(self):
+		size = self.camera.camera_config['lores']['size']
+		while not self._stop.is_set():
+			gray = lores_gray(self.camera.capture_array('lores'), size)
+			faces = self.detector.detect(None, gray)
+			self.frames += 1
+			if len(faces):  # keep the last good boxes if the student blinks or turns
+				self.faces = faces
+			self._stop.wait(self.interval)
+
+	def stop(self):
+		""" stops tracking, returns the latest boxes in main-stream coordinates (None if no face was seen) """
+		self._stop.set()
+		if self._thread is not None:
+			self._thread.join()
+		if self.faces is None:
+			return None
+		main_w, main_h = self.camera.camera_config['main']['size']
+		lores_w, lores_h = self.camera.camera_config['lores']['size']
+		faces = self.faces.astype(np.float32)
+		faces[:, [0, 2]] *= main_w / lores_w
+		faces[:, [1, 3]] *= main_h / lores_h
+		return np.rint(faces).astype(np.int32)
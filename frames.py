@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+import os
+import cv2
+import numpy as np
+
+from cartoon import TOP_PAD, BOTTOM_PAD
+
+#*#*# CHANGE ME *#*#*#
+# keyword found in the menu choice -> comic frame drawn over the photo
+FRAME_PATHS = {
+	'Expression': "/home/pi1/Pink_Comic_CFE_Final_2.png",
+	'Scientific': "/home/pi1/Blue_Comic_CSD_Final.png",
+	'Justic': "/home/pi1/Green_Comic_CSJ_Final_2.png",
+}
+COVERAGE_TILE = 32   # side of the squares the frame alpha is sorted into (opaque, clear or partial)
+
+class FrameAsset:
+	""" one comic frame, premultiplied once so add_frame only has to blend """
+	def __init__(self, foreground):
+		# fixed point: alpha stays 0-255 and colour * alpha fits in uint16
+		alpha = foreground[:, :, 3:4].astype(np.uint16)
+		self.premultiplied = foreground[:, :, :3] * alpha
+		self.inverse_alpha = 255 - alpha
+		self.shape = foreground.shape[:2]
+
+def blend_into(colour, background, premultiplied, inverse_alpha, work):
+	""" colour = round((fg * a + bg * (255 - a)) / 255) in uint16 math, all arguments the same size """
+	np.multiply(background, inverse_alpha, out=work)
+	np.add(work, premultiplied, out=work)
+	# rounded divide by 255: (x + 128 + ((x + 128) >> 8)) >> 8
+	np.add(work, 128, out=work)
+	np.right_shift(work, 8, out=colour, casting='unsafe')
+	np.add(work, colour, out=work)
+	np.right_shift(work, 8, out=colour, casting='unsafe')
+
+def coverage_spans(inverse_alpha, tile=COVERAGE_TILE):
+	""" sorts a window into tiles by frame alpha (given as 255 - alpha), returns (clear, partial) lists of
+		(y0, y1, x0, x1), neighbouring tiles of the same kind in a tile row are merged into one span """
+	height, width = inverse_alpha.shape
+	clear, partial = [], []
+	for y0 in range(0, height, tile):
+		y1 = min(height, y0 + tile)
+		kinds = []
+		for x0 in range(0, width, tile):
+			block = inverse_alpha[y0:y1, x0:x0 + tile]
+			if not block.any():
+				kinds.append('opaque')   # the cached canvas already has the frame here
+			elif block.min() == 255:
+				kinds.append('clear')    # the photo as it is
+			else:
+				kinds.append('partial')  # actually blended
+		start = 0
+		for i in range(1, len(kinds) + 1):
+			if i == len(kinds) or kinds[i] != kinds[start]:
+				span = (y0, y1, start * tile, min(width, i * tile))
+				if kinds[start] == 'clear':
+					clear.append(span)
+				elif kinds[start] == 'partial':
+					partial.append(span)
+				start = i
+	return clear, partial
+
+class Compositor:
+	""" keeps one BGRA canvas per frame with the white bands and the opaque artwork already blended,
+		each photo is copied where the frame is clear and blended only where the frame is partly see-through """
+	def __init__(self, tile=COVERAGE_TILE):
+		self.tile = tile
+		self.canvases = {}  # (frame, top, bottom) -> (canvas, clear spans, [(partial span, uint16 work buffer)])
+
+	def prepare(self, frame, top=TOP_PAD, bottom=BOTTOM_PAD):
+		""" the cached canvas and coverage spans of a frame, built on first use """
+		key = (frame, top, bottom)
+		if key not in self.canvases:
+			height, width = frame.shape
+			canvas = np.empty((height, width, 4), dtype=np.uint8)
+			canvas[:, :, 3] = 255  # result is always opaque
+			# bands are white for every photo, so they are blended once here
+			white = np.full((height, width, 3), 255, dtype=np.uint8)
+			blend_into(canvas[:, :, :3], white, frame.premultiplied, frame.inverse_alpha,
+				np.empty((height, width, 3), dtype=np.uint16))
+			# coverage index of the photo window, spans are in window coordinates
+			clear, partial = coverage_spans(frame.inverse_alpha[top:height - bottom, :, 0], self.tile)
+			partial = [(span, np.empty((span[1] - span[0], span[3] - span[2], 3), dtype=np.uint16)) for span in partial]
+			self.canvases[key] = (canvas, clear, partial)
+		return self.canvases[key]
+
+	def blend(self, photo, frame, top=TOP_PAD, bottom=BOTTOM_PAD):
+		""" photo is the window between the bands, returns the whole framed BGRA canvas """
+		window = (frame.shape[0] - top - bottom, frame.shape[1])
+		if photo.shape[:2] != window:
+			raise ValueError(f"Photo is {photo.shape[:2]} but the frame window is {window}")
+		return self.blend_rows(photo, frame, top, bottom)
+
+	def blend_rows(self, photo, frame, top=TOP_PAD, bottom=BOTTOM_PAD, row=0):
+		""" blends a strip of photo rows starting at row of the window; strips can run in parallel once
+			prepare() has made the canvas """
+		canvas, clear, partial = self.prepare(frame, top, bottom)
+		row_end = row + photo.shape[0]
+		colour = canvas[top + row:top + row_end, :, :3]
+		premultiplied = frame.premultiplied[top + row:top + row_end]
+		inverse_alpha = frame.inverse_alpha[top + row:top + row_end]
+		for y0, y1, x0, x1 in clear:
+			y0, y1 = max(y0, row) - row, min(y1, row_end) - row
+			if y0 < y1:
+				colour[y0:y1, x0:x1] = photo[y0:y1, x0:x1]
+		for (y0, y1, x0, x1), work in partial:
+			w0, y0, y1 = max(y0, row) - y0, max(y0, row) - row, min(y1, row_end) - row
+			if y0 < y1:
+				blend_into(colour[y0:y1, x0:x1], photo[y0:y1, x0:x1],
+					premultiplied[y0:y1, x0:x1], inverse_alpha[y0:y1, x0:x1], work[w0:w0 + y1 - y0])
+		return canvas
+
+class FrameCache:
+	""" loads every comic frame at startup and serves them by menu choice """
+	def __init__(self, frame_paths=FRAME_PATHS, scales=()):
+		self.frames = {}
+		self.scaled = {}  # (keyword, scale) -> smaller copy, e.g. for the quick preview
+		self.missing = []  # paths that weren't there, for the startup error if none were
+		for keyword, path in frame_paths.items():
+			if not os.path.exists(path):
+				print(f"Frame PNG not found: {path}")
+				self.missing.append(path)
+				continue
+			foreground = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+			self.frames[keyword] = FrameAsset(foreground)
+			for scale in scales:
+				height, width = foreground.shape[:2]
+				size = (round(width * scale), round(height * scale))
+				self.scaled[(keyword, scale)] = FrameAsset(cv2.resize(foreground, size, interpolation=cv2.INTER_AREA))
+
+	def get(self, choice, scale=1.0):
+		for keyword, frame in self.frames.items():
+			if keyword in choice:
+				return frame if scale == 1.0 else self.scaled[(keyword, scale)]
+		raise KeyError(f"No frame loaded for {choice}")
+
+	def shape(self):
+		""" (height, width) shared by every frame, the camera is set up to match it """
+		if not self.frames:
+			raise FileNotFoundError(f"No comic frame PNGs found, missing: {', '.join(self.missing)}")
+		shapes = set(frame.shape for frame in self.frames.values())
+		if len(shapes) != 1:
+			raise ValueError(f"Comic frames must all be the same size, found {sorted(shapes)}")
+		return shapes.pop()
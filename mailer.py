@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import uuid
+import queue
+import smtplib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from email import message_from_bytes
+from email.utils import getaddresses
+
+#*#*# CHANGE ME *#*#*#
+SMTP_SERVER = 'smtp.mail.umich.edu'
+SMTP_PORT = 587
+OUTBOX_DIR = '/home/pi1/outbox'   # composed emails wait here until they are sent
+FAILED_DIR = 'failed'             # under OUTBOX_DIR, emails the server will never take (bad address, rejected)
+RETRY_DELAY = 5                   # seconds before the first retry, doubled after every failure
+MAX_RETRY_DELAY = 300
+POOL_SIZE = 3                     # logged-in connections kept open, and emails sent at once
+NOOP_AFTER = 20                   # seconds idle before a pooled connection is checked with NOOP
+
+def recipients(msg):
+	""" addresses the message goes to, ValueError if there are none (nothing any server could deliver) """
+	addresses = [address for _, address in getaddresses(msg.get_all('To', []) + msg.get_all('Cc', []) + msg.get_all('Bcc', []))
+		if address]
+	if not addresses:
+		raise ValueError("Email has no recipient address")
+	return addresses
+
+def is_permanent(error):
+	""" True if sending this message again can't work: no recipient, or the server refused it with a 5xx """
+	if isinstance(error, ValueError):
+		return True
+	if isinstance(error, smtplib.SMTPRecipientsRefused):
+		# 4xx is greylisting or a rate limit, worth a retry; no recipients at all ({}) never will be
+		return all(500 <= code < 600 for code, _ in error.recipients.values())
+	# a 5xx at login or greeting is about the account or the server, not this message
+	if isinstance(error, (smtplib.SMTPAuthenticationError, smtplib.SMTPConnectError, smtplib.SMTPHeloError)):
+		return False
+	return isinstance(error, smtplib.SMTPResponseException) and 500 <= error.smtp_code < 600
+
+def smtp_send(msg, creds, server=SMTP_SERVER, port=SMTP_PORT, tls=True):
+	""" one connection per message, like the booth always did """
+	recipients(msg)
+	with smtplib.SMTP(server, port, timeout=60) as smtp:
+		if tls:
+			smtp.starttls()  # Secure the connection
+		smtp.login(creds['email'], creds['password'])
+		smtp.send_message(msg)
+
+class SMTPPool:
+	""" a few logged-in SMTP connections kept open, so TLS and login happen once instead of per email """
+	def __init__(self, creds, size=POOL_SIZE, server=SMTP_SERVER, port=SMTP_PORT, tls=True, noop_after=NOOP_AFTER):
+		self.creds = creds
+		self.server = server
+		self.port = port
+		self.tls = tls
+		self.noop_after = noop_after
+		self.idle = queue.LifoQueue()  # (connection, last used), newest first so old ones can time out
+		self.slots = threading.BoundedSemaphore(size)
+
+	def connect(self):
+		smtp = smtplib.SMTP(self.server, self.port, timeout=60)
+		try:
+			if self.tls:
+				smtp.starttls()  # Secure the connection
+			smtp.login(self.creds['email'], self.creds['password'])
+		except Exception:
+			close_quietly(smtp)
+			raise
+		return smtp
+
+	def _checkout(self):
+		""" an idle connection that still answers NOOP, or a new one """
+		while True:
+			try:
+				smtp, last_used = self.idle.get_nowait()
+			except queue.Empty:
+				return self.connect(), False
+			if time.time() - last_used < self.noop_after:
+				return smtp, True
+			try:
+				if smtp.noop()[0] == 250:
+					return smtp, True
+			except OSError:  # smtplib errors are OSErrors too
+				pass
+			close_quietly(smtp)
+
+	def send(self, msg):
+		recipients(msg)  # before taking a connection, an empty To: never reaches the server
+		with self.slots:
+			smtp, reused = self._checkout()
+			try:
+				smtp.send_message(msg)
+			except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused):
+				# server refused this message, smtplib already reset the session so the connection is fine
+				self.idle.put((smtp, time.time()))
+				raise
+			except OSError:
+				close_quietly(smtp)
+				if not reused:
+					raise
+				# the server dropped an idle connection under us, reconnect once
+				smtp = self.connect()
+				try:
+					smtp.send_message(msg)
+				except Exception:
+					close_quietly(smtp)
+					raise
+			except Exception:
+				close_quietly(smtp)
+				raise
+			self.idle.put((smtp, time.time()))
+
+	def close(self):
+		while True:
+			try:
+				smtp, _ = self.idle.get_nowait()
+			except queue.Empty:
+				return
+			try:
+				smtp.quit()
+			except Exception:
+				close_quietly(smtp)
+
+def close_quietly(smtp):
+	try:
+		smtp.close()
+	except Exception:
+		pass
+
+class Outbox:
+	""" spool directory of composed emails, drained by a background sender with exponential backoff """
+	def __init__(self, send, spool_dir=OUTBOX_DIR, retry_delay=RETRY_DELAY, max_retry_delay=MAX_RETRY_DELAY, senders=1):
+		self.send = send
+		self.senders = senders  # emails sent at once, match the SMTPPool size
+		self.lock = threading.Lock()
+		self.spool_dir = spool_dir
+		self.retry_delay = retry_delay
+		self.max_retry_delay = max_retry_delay
+		self.retries = {}  # name -> (attempts, next try), a restart just retries everything right away
+		self.failed_dir = os.path.join(spool_dir, FAILED_DIR)  # permanent failures are moved here, not retried
+		self.wakeup = threading.Event()
+		os.makedirs(self.failed_dir, exist_ok=True)
+
+	def enqueue(self, msg):
+		""" writes the message to disk and returns, the sender thread does the rest """
+		name = f'{time.time():.6f}_{uuid.uuid4().hex}.eml'  # sorts oldest first
+		tmp_path = os.path.join(self.spool_dir, name + '.tmp')
+		with open(tmp_path, 'wb') as f:
+			f.write(msg.as_bytes())
+			f.flush()
+			os.fsync(f.fileno())
+		os.replace(tmp_path, os.path.join(self.spool_dir, name))
+		self.wakeup.set()
+		return name
+
+	def pending(self):
+		return sorted(name for name in os.listdir(self.spool_dir) if name.endswith('.eml'))
+
+	def failed(self):
+		return sorted(name for name in os.listdir(self.failed_dir) if name.endswith('.eml'))
+
+	def start(self):
+		threading.Thread(target=self._run, daemon=True).start()
+
+	def _run(self):
+		while True:
+			try:
+				self.drain()
+			except Exception as e:  # e.g. the spool disk, the thread has to live until the booth shuts down
+				print(f'Outbox drain failed, trying again in {self.retry_delay}s: {e}')
+			self.wakeup.wait(timeout=self.retry_delay)
+			self.wakeup.clear()
+
+	def drain(self):
+		""" tries every message that is due, a message is only deleted once the server took it """
+		now = time.time()
+		with self.lock:
+			due = [name for name in self.pending() if self.retries.get(name, (0, 0))[1] <= now]
+		if self.senders == 1:
+			for name in due:
+				self._deliver(name)
+			return
+		with ThreadPoolExecutor(max_workers=self.senders) as senders:
+			list(senders.map(self._deliver, due))
+
+	def _deliver(self, name):
+		path = os.path.join(self.spool_dir, name)
+		try:
+			with open(path, 'rb') as f:
+				self.send(message_from_bytes(f.read()))
+		except Exception as e:
+			if is_permanent(e):
+				os.replace(path, os.path.join(self.failed_dir, name))
+				with self.lock:
+					self.retries.pop(name, None)
+				print(f'Email {name} can never be sent, moved to {self.failed_dir}: {e!r}')
+				return
+			with self.lock:
+				attempts = self.retries.get(name, (0, 0))[0] + 1
+				delay = min(self.max_retry_delay, self.retry_delay * 2 ** (attempts - 1))
+				self.retries[name] = (attempts, time.time() + delay)
+			print(f'Failed to send email {name} (try {attempts}, next in {delay}s): {e}')
+			return
+		os.remove(path)
+		with self.lock:
+			self.retries.pop(name, None)
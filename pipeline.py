@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+""" the cartoon pipeline, kept apart from ShPiBver1.py so it can run in a worker process (and off the Pi) """
+
+import os
+import time
+import cv2
+import numpy as np
+
+from frames import FrameCache, Compositor
+from quantize import PaletteCache
+from cartoon import TOP_PAD, BOTTOM_PAD
+from faces import FaceDetector
+from renditions import write_renditions
+from stages import make_pool
+from arena import BufferArena
+from tiles import framed_strips, STRIP_HEIGHT
+from styles import get_style
+from edges import EDGE_BACKENDS
+
+haar_cascade_path = '/home/pi1/Downloads/haarcascade_frontalface_default.xml'
+
+face_cascade = None
+if not os.path.exists(haar_cascade_path):
+	print("Haar Cascade XML file not found at the specified location.")
+else:
+	face_cascade = cv2.CascadeClassifier(haar_cascade_path)
+#*#*# CHANGE ME *#*#*# 'full' searches the whole photo at every scale like before
+face_detector = FaceDetector(face_cascade, mode='fast')
+
+#*#*# CHANGE ME *#*#*#
+PREVIEW_SCALE = 0.4  # the Approve/Retake preview is cartoonized at this fraction of the photo size
+PREVIEW_TOP, PREVIEW_BOTTOM = round(TOP_PAD * PREVIEW_SCALE), round(BOTTOM_PAD * PREVIEW_SCALE)
+PREVIEW_RENDITION = {'preview': {'suffix': '_cart_quick.jpg', 'long_side': None, 'quality': 80}}
+
+frame_cache = FrameCache(scales=(PREVIEW_SCALE,))  # comic frames loaded once, served by menu choice
+compositor = Compositor()  # one BGRA canvas per frame, bands and artwork blended once
+preview_compositor = Compositor()
+
+palette_cache = PaletteCache()  # palette from earlier sessions, survives restarts
+
+#*#*# CHANGE ME *#*#*# False allocates fresh arrays in every stage like before
+BUFFER_ARENA = True
+# stage outputs, allocated on the first photo (and first preview) and written with dst= after that
+arena = BufferArena() if BUFFER_ARENA else None
+
+stage_pool = make_pool()  # its threads only start on the first photo, i.e. inside the worker process
+stage_timings = {}  # seconds per stage of the last cartoonize
+STAGE_MESSAGES = {'faces': 'Finding your face', 'edges': 'Drawing outlines', 'colour': 'Mixing colors'}
+
+#*#*# CHANGE ME *#*#*#
+QUANTIZE_MODE = 'warm'  # 'full' runs k-means on every pixel like before
+QUANTIZE_SETTINGS = {
+	'full': {'attempts': 10, 'iterations': 100},
+	'sampled': {'sample_size': 20000, 'attempts': 3, 'iterations': 20},
+	'warm': {'cache': palette_cache, 'sample_size': 20000, 'refine_iterations': 1},
+	'lut': {'cache': palette_cache, 'sample_size': 20000, 'bits': 5},  # fastest, for when the line builds up
+}
+
+#*#*# CHANGE ME *#*#*# or start the booth with BOOTH_STYLE=bilateral, see styles.py for the list
+STYLE = os.environ.get('BOOTH_STYLE', 'kmeans')
+STYLE_SETTINGS = {  # passed to the style's colour step
+	'kmeans': {'mode': QUANTIZE_MODE, **QUANTIZE_SETTINGS[QUANTIZE_MODE]},
+	'bilateral': {'backend': 'downsampled'},  # 'bilateral' filters the full-size photo like DratsX3 did
+}
+
+#*#*# CHANGE ME *#*#*# or BOOTH_EDGES=canny, unset keeps the style's own outlines; `python3 bench.py edges` shows the cost
+EDGE_BACKEND = os.environ.get('BOOTH_EDGES') or None
+EDGE_SETTINGS = {
+	'adaptive': {'median': 7, 'block_size': 9, 'c': 5},
+	'canny': {'low': 100, 'high': 200, 'blur': 5, 'thickness': 2},  # clean flat areas, lines only on strong edges
+	'dog': {'sigma': 1.0, 'k': 1.6, 'tau': 0.98, 'eps': -1.0},
+	'downscaled': {'scale': 0.5, 'inner': 'adaptive'},  # adaptive at a third of the cost, slightly thicker lines
+}
+
+#*#*# CHANGE ME *#*#*# True for 12MP sensors: cartoon and frame are made strip by strip (STRIP_HEIGHT rows)
+# on the stage pool, so memory stays at a few strips instead of several whole-photo copies
+TILED = False
+
+# a typo in the style or outline name should stop the booth at startup, not at the first photo
+get_style(STYLE)
+if EDGE_BACKEND and EDGE_BACKEND not in EDGE_BACKENDS:
+	raise ValueError(f"Unknown edge backend {EDGE_BACKEND}, pick one of {', '.join(EDGE_BACKENDS)}")
+
+def add_frame(cartoon, choice): #takes in openCV image (of picture taken)
+	# frame PNG was decoded and premultiplied once at startup
+	frame = frame_cache.get(choice)
+	# white bands and frame artwork are already on this frame's canvas, only the photo window is blended
+	return compositor.blend(cartoon, frame, TOP_PAD, BOTTOM_PAD)
+			
+def detect_face(image, gray=None):
+	# Use OpenCV Haar Cascade for face detection ('fast' searches a downscaled central region)
+	return face_detector.detect(image, gray)
+
+def no_progress(stage):
+	pass
+
+def process_image(image, file_path, choice, faces=None, gray=None, progress=no_progress):
+	# image comes straight from the camera, file_path only names the output
+	# progress(stage) is called as each step starts, the worker forwards it to the screen
+	if TILED:
+		final = framed_cartoon_strips(image, faces, gray, choice, progress)
+	else:
+		cartoon = cartoonize(image, faces, gray, progress)
+
+		# frame
+		progress('Adding your comic frame')
+		final = add_frame(cartoon, choice)
+	progress('Printing press warming up')
+	# print and email files, each sized for whoever reads it (the Approve screen showed the quick preview)
+	return write_renditions(final, file_path, arena=arena)
+
+def preview_proxy(image, choice, faces=None, gray=None):
+	""" photo, faces and grayscale shrunk to the preview frame's window; run before submitting the preview job,
+		so the job pipe carries the small proxy instead of the full-size photo """
+	frame = frame_cache.get(choice, PREVIEW_SCALE)
+	width, height = frame.shape[1], frame.shape[0] - PREVIEW_TOP - PREVIEW_BOTTOM
+	scale_x, scale_y = width / image.shape[1], height / image.shape[0]
+	# fresh arrays, not the arena: the job queue pickles them later on its own thread
+	image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+	if gray is not None:
+		gray = cv2.resize(gray, (width, height), interpolation=cv2.INTER_AREA)
+	if faces is not None:
+		faces = np.rint(np.asarray(faces, dtype=np.float32) * [scale_x, scale_y, scale_x, scale_y]).astype(np.int32)
+	return image, faces, gray
+
+def process_preview(image, file_path, choice, faces=None, gray=None, progress=no_progress):
+	# same cartoon on a small proxy of the photo, just good enough to Approve or Retake
+	frame = frame_cache.get(choice, PREVIEW_SCALE)
+	if image.shape[:2] != (frame.shape[0] - PREVIEW_TOP - PREVIEW_BOTTOM, frame.shape[1]):
+		image, faces, gray = preview_proxy(image, choice, faces, gray)
+	cartoon = cartoonize(image, faces, gray, progress)
+	progress('Adding your comic frame')
+	final = preview_compositor.blend(cartoon, frame, PREVIEW_TOP, PREVIEW_BOTTOM)
+	return write_renditions(final, file_path, PREVIEW_RENDITION, arena)
+
+def cartoonize(image, faces, gray, progress, style=None):
+	""" face smoothing, outlines and colors in the chosen style, returns the cartoon at the photo's size """
+	style = get_style(style or STYLE)
+	graph = style.graph(image, faces, gray, detect_face, STYLE_SETTINGS.get(style.name, {}), edge_settings(), arena)
+
+	# the branches only share the grayscale photo, so they run side by side on the stage pool
+	def started(stage):
+		if stage in STAGE_MESSAGES:
+			progress(STAGE_MESSAGES[stage])
+	results, timings = graph.run(stage_pool, started)
+	stage_timings.clear()
+	stage_timings.update(timings)
+	return results['render']
+
+def framed_cartoon_strips(image, faces, gray, choice, progress, style=None):
+	""" tiled mode: the whole-photo steps first, then cartoon and frame strip by strip, returns the framed canvas """
+	style = get_style(style or STYLE)
+	start = time.perf_counter()
+	progress('Finding your face')
+	face_layer, colour_rows, edge_rows = style.strip_rows(image, faces, gray, detect_face,
+		STYLE_SETTINGS.get(style.name, {}), edge_settings())
+	prepared = time.perf_counter()
+	progress('Drawing outlines')
+	final = framed_strips(image.shape, colour_rows, edge_rows, face_layer, style.kernel(image.shape),
+		frame_cache.get(choice), compositor, TOP_PAD, BOTTOM_PAD, stage_pool, STRIP_HEIGHT)
+	stage_timings.clear()
+	stage_timings.update({'prepare': prepared - start, 'strips': time.perf_counter() - prepared})
+	return final
+
+def edge_settings():
+	""" EDGE_BACKEND with its settings, None keeps the style's own outlines """
+	return {'backend': EDGE_BACKEND, **EDGE_SETTINGS.get(EDGE_BACKEND, {})} if EDGE_BACKEND else None
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+
+import os
+import cv2
+import numpy as np
+
+from arena import scratch
+
+#*#*# CHANGE ME *#*#*#
+KMEANS_K = 8
+SAMPLE_SIZE = 20000      # pixels the palette is trained on in 'sampled' mode
+SAMPLE_ATTEMPTS = 3      # cv2.kmeans restarts on the sample
+SAMPLE_ITERATIONS = 20   # max iterations per restart on the sample
+ASSIGN_CHUNK = 1 << 18   # pixels per block when mapping the frame to the palette
+PALETTE_CACHE_PATH = '/home/pi1/palette_cache.npz'
+HISTOGRAM_DRIFT = 0.25   # share of the colour histogram that may move before a full solve
+HISTOGRAM_MEMORY = 0.7   # how much of the cached histogram is kept after each session
+LUT_BITS = 5             # 5 bits per channel -> 32x32x32 lookup table
+
+def kmeans_full(image, k=KMEANS_K, attempts=10, iterations=100, arena=None):
+	""" original booth quantizer: k-means over every pixel of the capture """
+	pixel_values = scratch(arena, 'kmeans_pixels', (image.shape[0] * image.shape[1], 3), np.float32)
+	pixel_values[:] = image.reshape((-1, 3))
+	_, labels, centers = cv2.kmeans(pixel_values, k, None, (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, iterations, 0.2), attempts, cv2.KMEANS_RANDOM_CENTERS)
+	centers = np.uint8(centers)
+	quantized_img = np.take(centers, labels.ravel(), axis=0, out=scratch(arena, 'quantized', pixel_values.shape))
+	return quantized_img.reshape(image.shape)
+
+def stratified_sample(image, sample_size=SAMPLE_SIZE, rng=None):
+	""" one random pixel from each cell of a grid with ~sample_size cells """
+	rng = np.random.default_rng() if rng is None else rng
+	height, width = image.shape[:2]
+	step = max(1, int(np.sqrt(height * width / sample_size)))
+	rows = np.arange(0, height, step)
+	cols = np.arange(0, width, step)
+	ys = np.minimum(rows[:, None] + rng.integers(0, step, (len(rows), len(cols))), height - 1)
+	xs = np.minimum(cols[None, :] + rng.integers(0, step, (len(rows), len(cols))), width - 1)
+	return np.float32(image[ys, xs].reshape((-1, 3)))
+
+def train_palette(samples, k=KMEANS_K, attempts=SAMPLE_ATTEMPTS, iterations=SAMPLE_ITERATIONS):
+	""" k-means on a pixel sample, returns float32 centers """
+	_, _, centers = cv2.kmeans(samples, k, None, (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, iterations, 0.2), attempts, cv2.KMEANS_PP_CENTERS)
+	return centers
+
+def assign_palette(image, centers, arena=None):
+	""" maps every pixel to its nearest center, in blocks to bound memory """
+	pixel_values = image.reshape((-1, 3))
+	centers = np.float32(centers)
+	# argmin |p - c|^2 == argmin |c|^2 - 2 p.c, so the |p|^2 term is never needed
+	weights = -2 * centers.T
+	offsets = (centers ** 2).sum(axis=1)
+	palette = np.uint8(np.clip(np.rint(centers), 0, 255))
+	quantized_img = scratch(arena, 'quantized', pixel_values.shape)
+	chunk = min(ASSIGN_CHUNK, len(pixel_values))
+	block = scratch(arena, 'assign_block', (chunk, 3), np.float32)
+	scores = scratch(arena, 'assign_scores', (chunk, len(centers)), np.float32)
+	labels = scratch(arena, 'assign_labels', (chunk,), np.intp)
+	for start in range(0, len(pixel_values), chunk):
+		n = min(chunk, len(pixel_values) - start)
+		block[:n] = pixel_values[start:start + n]
+		np.matmul(block[:n], weights, out=scores[:n])
+		scores[:n] += offsets
+		np.argmin(scores[:n], axis=1, out=labels[:n])
+		np.take(palette, labels[:n], axis=0, out=quantized_img[start:start + n])
+	return quantized_img.reshape(image.shape)
+
+def kmeans_sampled(image, k=KMEANS_K, sample_size=SAMPLE_SIZE, attempts=SAMPLE_ATTEMPTS, iterations=SAMPLE_ITERATIONS,
+		arena=None):
+	""" trains the palette on a stratified sample, then maps the whole frame once """
+	centers = train_palette(stratified_sample(image, sample_size), k, attempts, iterations)
+	return assign_palette(image, centers, arena)
+
+def colour_histogram(samples):
+	""" normalized 8x8x8 RGB histogram of a pixel sample """
+	bins = np.uint16(samples) >> 5
+	index = (bins[:, 0] << 6) | (bins[:, 1] << 3) | bins[:, 2]
+	counts = np.bincount(index, minlength=512).astype(np.float32)
+	return counts / counts.sum()
+
+def refine_palette(samples, centers, iterations=1):
+	""" plain Lloyd steps starting from known centers """
+	centers = np.float32(centers).copy()
+	for _ in range(iterations):
+		scores = samples @ (-2 * centers.T) + (centers ** 2).sum(axis=1)
+		labels = scores.argmin(axis=1)
+		for i in range(len(centers)):
+			members = samples[labels == i]
+			if len(members):  # an empty cluster keeps its old center
+				centers[i] = members.mean(axis=0)
+	return centers
+
+class PaletteCache:
+	""" palette and colour histogram from recent sessions, kept on disk across restarts """
+	def __init__(self, path=PALETTE_CACHE_PATH, drift=HISTOGRAM_DRIFT):
+		self.path = path
+		self.drift = drift
+		self.centers = None
+		self.histogram = None
+		if os.path.exists(path):
+			try:
+				with np.load(path) as saved:
+					self.centers = saved['centers']
+					self.histogram = saved['histogram']
+			except Exception as e:
+				print(f"Ignoring palette cache {path}: {e}")
+
+	def palette(self, samples, k=KMEANS_K, refine_iterations=1):
+		""" warm start from the cached palette, full solve only if the lighting moved """
+		histogram = colour_histogram(samples)
+		warm = self.centers is not None and len(self.centers) == k \
+			and 0.5 * np.abs(histogram - self.histogram).sum() <= self.drift
+		if warm:
+			centers = refine_palette(samples, self.centers, refine_iterations)
+			histogram = HISTOGRAM_MEMORY * self.histogram + (1 - HISTOGRAM_MEMORY) * histogram
+		else:
+			centers = train_palette(samples, k, attempts=10, iterations=100)
+		self.centers, self.histogram = centers, histogram
+		self.save()
+		return centers
+
+	def save(self):
+		tmp_path = f'{self.path}.{os.getpid()}.tmp.npz'  # each worker process writes its own temp file
+		try:
+			np.savez(tmp_path, centers=self.centers, histogram=self.histogram)
+			os.replace(tmp_path, self.path)
+		except OSError as e:
+			print(f"Failed to save palette cache: {e}")
+
+def kmeans_warm(image, cache, k=KMEANS_K, sample_size=SAMPLE_SIZE, refine_iterations=1, arena=None):
+	""" sampled k-means seeded from the palette of earlier sessions """
+	centers = cache.palette(stratified_sample(image, sample_size), k, refine_iterations)
+	return assign_palette(image, centers, arena)
+
+def build_lut(centers, bits=LUT_BITS):
+	""" palette colour for every cell of a (2^bits)^3 BGR grid, indexed b<<2bits | g<<bits | r """
+	levels = 1 << bits
+	step = 256 // levels
+	cell = np.arange(levels, dtype=np.float32) * step + (step - 1) / 2.0  # middle of each cell
+	b, g, r = np.meshgrid(cell, cell, cell, indexing='ij')
+	grid = np.stack([b.ravel(), g.ravel(), r.ravel()], axis=1)
+	return assign_palette(grid.reshape((-1, 1, 3)), centers).reshape((-1, 3))
+
+def apply_lut(image, lut, bits=LUT_BITS, arena=None):
+	""" one table lookup per pixel, no float copy of the image """
+	shift = 8 - bits
+	cells = np.right_shift(image, shift, out=scratch(arena, 'lut_cells', image.shape))
+	index = scratch(arena, 'lut_index', image.shape[:2], np.uint16)
+	part = scratch(arena, 'lut_part', image.shape[:2], np.uint16)
+	index[:] = cells[:, :, 0]
+	index <<= 2 * bits
+	part[:] = cells[:, :, 1]
+	part <<= bits
+	index |= part
+	index |= cells[:, :, 2]
+	return np.take(lut, index, axis=0, out=scratch(arena, 'quantized', image.shape))
+
+def lut_quantize(image, cache=None, k=KMEANS_K, sample_size=SAMPLE_SIZE, bits=LUT_BITS, arena=None):
+	""" palette from the warm cache (or a fresh sample), then the 3D lookup table """
+	samples = stratified_sample(image, sample_size)
+	if cache is not None:
+		centers = cache.palette(samples, k)
+	else:
+		centers = train_palette(samples, k)
+	return apply_lut(image, build_lut(centers, bits), bits, arena)
+
+def strip_quantizer(image, mode='sampled', k=KMEANS_K, sample_size=SAMPLE_SIZE, cache=None,
+		attempts=SAMPLE_ATTEMPTS, iterations=SAMPLE_ITERATIONS, refine_iterations=1, bits=LUT_BITS):
+	""" palette from the whole photo, returns (function mapping one strip of it, 0 halo rows), None for 'full' """
+	if mode == 'full':  # needs every pixel at once
+		return None
+	samples = stratified_sample(image, sample_size)
+	if mode == 'sampled':
+		centers = train_palette(samples, k, attempts, iterations)
+	elif cache is not None:
+		centers = cache.palette(samples, k, refine_iterations)
+	else:
+		centers = train_palette(samples, k)
+	if mode == 'lut':
+		lut = build_lut(centers, bits)
+		return lambda strip: apply_lut(strip, lut, bits), 0
+	return lambda strip: assign_palette(strip, centers), 0
+
+QUANTIZE_MODES = {
+	'full': kmeans_full,
+	'sampled': kmeans_sampled,
+	'warm': kmeans_warm,
+	'lut': lut_quantize,
+}
+
+def quantize(image, mode='sampled', **settings):
+	""" colour quantization used by process_image, mode picks the method """
+	return QUANTIZE_MODES[mode](image, **settings)
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+
+import cv2
+
+from arena import scratch
+
+#*#*# CHANGE ME *#*#*#
+# every consumer gets its own file: lp prints full size, email gets a small progressive JPEG
+# (feh shows the quick preview job's _cart_quick.jpg, see pipeline.process_preview)
+RENDITIONS = {
+	'print': {'suffix': '_cart.jpg', 'long_side': None, 'quality': 95},
+	'email': {'suffix': '_cart_email.jpg', 'long_side': 1280, 'quality': 80, 'progressive': True},
+}
+
+def resize_long_side(image, long_side, arena=None):
+	""" shrinks so the longer side is long_side, never enlarges """
+	height, width = image.shape[:2]
+	scale = long_side / max(height, width) if long_side else 1.0
+	if scale >= 1.0:
+		return image
+	size = (round(width * scale), round(height * scale))
+	dst = scratch(arena, 'rendition', (size[1], size[0]) + image.shape[2:])
+	return cv2.resize(image, size, dst=dst, interpolation=cv2.INTER_AREA)
+
+def write_renditions(final, file_path, renditions=RENDITIONS, arena=None):
+	""" writes every rendition of the finished composite, returns {name: path} """
+	base_path = file_path.replace('photos', 'photos_cartoon').replace('.jpg', '')
+	paths = {}
+	# biggest first, so each smaller one is shrunk from the previous instead of the full frame
+	for name, spec in sorted(renditions.items(), key=lambda item: -(item[1]['long_side'] or float('inf'))):
+		final = resize_long_side(final, spec['long_side'], arena)
+		params = [cv2.IMWRITE_JPEG_QUALITY, spec['quality']]
+		if spec.get('progressive'):
+			params += [cv2.IMWRITE_JPEG_PROGRESSIVE, 1, cv2.IMWRITE_JPEG_OPTIMIZE, 1]
+		paths[name] = base_path + spec['suffix']
+		cv2.imwrite(paths[name], final, params)
+	return paths
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+""" edge-preserving smoothing for the bilateral style, the full-size bilateralFilter and faster stand-ins """
+
+import math
+import cv2
+import numpy as np
+
+from arena import scratch
+
+#*#*# CHANGE ME *#*#*#
+BILATERAL_D, BILATERAL_SIGMA = 9, 250   # what DratsX3/DratsX4/zoltar used
+DOWNSAMPLE = 0.5                        # 'downsampled' filters at this fraction of the photo size
+GUIDED_RADIUS = 6
+GUIDED_EPS = 0.02                       # on 0..1 pixel values, bigger flattens more
+
+def bilateral(image, d=BILATERAL_D, sigma_color=BILATERAL_SIGMA, sigma_space=BILATERAL_SIGMA, arena=None):
+	""" the original: bilateralFilter on every pixel of the photo """
+	return cv2.bilateralFilter(image, d, sigma_color, sigma_space, dst=scratch(arena, 'smoothed', image.shape))
+
+def box_mean(image, radius):
+	return cv2.boxFilter(image, -1, (2 * radius + 1, 2 * radius + 1))
+
+def guided_coefficients(guide, target, radius, eps):
+	""" per-pixel a, b so that a * guide + b is the locally best match to target (He et al. guided filter) """
+	mean_guide = box_mean(guide, radius)
+	mean_target = box_mean(target, radius)
+	covariance = box_mean(guide * target, radius) - mean_guide * mean_target
+	variance = box_mean(guide * guide, radius) - mean_guide * mean_guide
+	a = covariance / (variance + eps)
+	b = mean_target - a * mean_guide
+	return box_mean(a, radius), box_mean(b, radius)
+
+def guided(image, radius=GUIDED_RADIUS, eps=GUIDED_EPS, arena=None):
+	""" self-guided filter on each channel, a few box filters whatever the radius """
+	guide = image.astype(np.float32) / 255
+	a, b = guided_coefficients(guide, guide, radius, eps)
+	return cv2.convertScaleAbs(a * guide + b, dst=scratch(arena, 'smoothed', image.shape), alpha=255)
+
+def downsampled(image, scale=DOWNSAMPLE, d=BILATERAL_D, sigma_color=BILATERAL_SIGMA, sigma_space=BILATERAL_SIGMA,
+		radius=GUIDED_RADIUS, arena=None):
+	""" bilateralFilter on a small copy, brought back to full size by guided (joint) upsampling """
+	height, width = image.shape[:2]
+	small = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+	filtered = cv2.bilateralFilter(small, max(3, int(d * scale) | 1), sigma_color, sigma_space * scale)
+	# fit filtered ~ a * small + b at low res, then apply the upsampled a, b to the full-size photo,
+	# so edges come from the full-size pixels instead of a blurry resize
+	guide = small.astype(np.float32) / 255
+	a, b = guided_coefficients(guide, filtered.astype(np.float32) / 255, max(1, int(radius * scale)), 1e-4)
+	a = cv2.resize(a, (width, height), interpolation=cv2.INTER_LINEAR)
+	b = cv2.resize(b, (width, height), interpolation=cv2.INTER_LINEAR)
+	return cv2.convertScaleAbs(a * (image.astype(np.float32) / 255) + b, dst=scratch(arena, 'smoothed', image.shape), alpha=255)
+
+def edge_preserving(image, sigma_s=60, sigma_r=0.4, arena=None):
+	""" OpenCV's domain transform filter (recursive version) """
+	return cv2.edgePreservingFilter(image, dst=scratch(arena, 'smoothed', image.shape), flags=cv2.RECURS_FILTER,
+		sigma_s=sigma_s, sigma_r=sigma_r)
+
+SMOOTHING_BACKENDS = {
+	'bilateral': bilateral,
+	'downsampled': downsampled,
+	'guided': guided,
+	'edge_preserving': edge_preserving,
+}
+
+def edge_preserving_smooth(image, backend='bilateral', **settings):
+	""" colour step of the bilateral style, backend picks the method """
+	return SMOOTHING_BACKENDS[backend](image, **settings)
+
+def strip_smoother(image, backend='bilateral', **settings):
+	""" (function smoothing one strip, halo rows it needs above and below), None if the backend needs the whole photo """
+	if backend == 'bilateral':
+		halo = settings.get('d', BILATERAL_D) // 2
+	elif backend == 'guided':
+		halo = 2 * settings.get('radius', GUIDED_RADIUS) + 1  # a box filter of box filters
+	elif backend == 'downsampled':
+		scale = settings.get('scale', DOWNSAMPLE)
+		small_halo = max(3, int(settings.get('d', BILATERAL_D) * scale) | 1) // 2 \
+			+ 2 * max(1, int(settings.get('radius', GUIDED_RADIUS) * scale)) + 2
+		halo = math.ceil(small_halo / scale)
+	else:  # edge_preserving filters along whole rows and columns
+		return None
+	return (lambda strip: SMOOTHING_BACKENDS[backend](strip, **settings)), halo
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+#*#*# CHANGE ME *#*#*#
+STAGE_THREADS = 4   # one per Pi 5 core, OpenCV drops the GIL inside its calls
+
+class StageGraph:
+	""" pipeline stages with their inputs, independent ones run at the same time on a thread pool """
+	def __init__(self):
+		self.stages = {}  # name -> (func, names of the stages it needs), in the order they were added
+
+	def add(self, name, func, *needs):
+		for need in needs:
+			if need not in self.stages:
+				raise ValueError(f"Stage {name} needs {need}, add that one first")
+		self.stages[name] = (func, needs)
+
+	def run(self, pool, on_start=None):
+		""" runs every stage once its inputs are ready, returns ({name: result}, {name: seconds}) """
+		results = {}
+		timings = {}
+		running = {}
+		waiting = dict(self.stages)
+
+		def timed(name, func, args):
+			if on_start is not None:
+				on_start(name)
+			start = time.perf_counter()
+			result = func(*args)
+			timings[name] = time.perf_counter() - start
+			return result
+
+		while waiting or running:
+			for name, (func, needs) in list(waiting.items()):
+				if all(need in results for need in needs):
+					running[pool.submit(timed, name, func, [results[need] for need in needs])] = name
+					del waiting[name]
+			done, _ = wait(running, return_when=FIRST_COMPLETED)
+			for future in done:
+				name = running.pop(future)
+				try:
+					results[name] = future.result()
+				except BaseException:
+					# let stages that already started finish before giving up, nothing new is started
+					wait(running)
+					raise
+		return results, timings
+
+def make_pool(threads=STAGE_THREADS):
+	return ThreadPoolExecutor(max_workers=threads, thread_name_prefix='stage')
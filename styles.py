@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+""" cartoon styles: every booth script's look, built from the same shared stages and picked by name """
+
+import cv2
+import numpy as np
+
+from stages import StageGraph
+from quantize import quantize, strip_quantizer
+from smoothing import edge_preserving_smooth, strip_smoother
+from edges import find_edges, edge_halo
+from tiles import rows_of
+from arena import scratch
+from cartoon import CartoonKernel, FaceLayer, FACE_WEIGHT, CONTRAST_ALPHA, CONTRAST_BETA
+
+FACE_BLUR = 41  # soft edge of the face mask, in pixels
+
+def face_regions(faces, shape, pad=FACE_BLUR // 2):
+	""" face boxes grown by the blur radius and clipped to the photo, overlapping ones merged (x0, y0, x1, y1) """
+	height, width = shape[:2]
+	regions = [[max(0, x - pad), max(0, y - pad), min(width, x + w + pad), min(height, y + h + pad)]
+		for (x, y, w, h) in faces]
+	merged = True
+	while merged:  # group shots: blurred masks of close faces overlap, so they share a region
+		merged = False
+		for i in range(len(regions)):
+			for j in range(i + 1, len(regions)):
+				a, b = regions[i], regions[j]
+				if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+					regions[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+					del regions[j]
+					merged = True
+					break
+			if merged:
+				break
+	return regions
+
+def smooth(image, faces):
+	""" softened faces as a FaceLayer, the work only covers the face boxes (plus the blur radius) """
+	# outside the faces the photo is 0, which the brightness tweak below turns into one flat level
+	background = cv2.convertScaleAbs(np.zeros((1, 1), dtype=np.uint8), alpha=0.8, beta=-10)[0, 0]
+	layer = FaceLayer(background)
+	for x0, y0, x1, y1 in face_regions(faces, image.shape):
+		# single-channel mask with an elliptical region per face (as before), in region coordinates
+		mask = np.zeros((y1 - y0, x1 - x0), dtype=np.float32)
+		for (x, y, w, h) in faces:
+			center = (int(x + w // 2 - x0), int(y + h // 2 - y0))
+			axes = (int(w // 2), int(h // 2))
+			cv2.ellipse(mask, center, axes, 0, 0, 360, 1.0, -1)  # Fill face with 1
+		# Apply Gaussian blur to smooth out the edges of the face region (even softer)
+		mask = cv2.GaussianBlur(mask, (FACE_BLUR, FACE_BLUR), 0)
+		# Extract the face region by applying the soft mask
+		face_region = cv2.multiply(image[y0:y1, x0:x1], cv2.merge((mask, mask, mask)), dtype=cv2.CV_32F)
+		# Normalize the face region's brightness if needed to match the rest of the image
+		layer.patches.append((x0, y0, cv2.convertScaleAbs(face_region, alpha=0.8, beta=-10)))
+	return layer
+
+def posterize(image, levels=4, arena=None):
+	""" fixed colour levels per channel through a lookup table, no palette to train """
+	step = 256 // levels
+	table = np.uint8(np.minimum(np.arange(256) // step * step + step // 2, 255))
+	return cv2.LUT(image, table, dst=scratch(arena, 'posterized', image.shape))
+
+class Style:
+	""" one cartoon look: how the colours are made and how they are mixed, the other stages are shared """
+	def __init__(self, name, colour, edges=None, face_weight=FACE_WEIGHT, alpha=CONTRAST_ALPHA, beta=CONTRAST_BETA,
+			strips=None):
+		self.name = name
+		self.colour = colour  # colour(image, **settings) -> BGR image
+		self.strips = strips  # strips(image, **settings) -> (colour for one strip, halo rows) or None, for tiled mode
+		self.edges = edges or {}  # find_edges backend and settings, the original adaptive threshold if empty
+		self.face_weight = face_weight  # 0 skips face detection and smoothing
+		self.alpha, self.beta = alpha, beta
+		self.kernels = {}  # photo shape -> CartoonKernel, so the preview and the full photo keep their buffers
+
+	def kernel(self, shape):
+		if shape not in self.kernels:
+			# no white bands, the compositor's canvas already has them
+			self.kernels[shape] = CartoonKernel(self.face_weight, self.alpha, self.beta, top=0, bottom=0)
+		return self.kernels[shape]
+
+	def graph(self, image, faces, gray, detect, settings, edges=None, arena=None):
+		""" stages for one photo, 'render' is the finished cartoon, edges replaces the style's outlines,
+			arena (if any) supplies the stage outputs """
+		edges = edges or self.edges
+		graph = StageGraph()
+		# grayscale is shared by the face search and the outlines
+		graph.add('gray', lambda: cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=scratch(arena, 'gray', image.shape[:2]))
+			if gray is None else gray)
+		if self.face_weight:
+			# nothing from the countdown tracker, search the full photo
+			graph.add('faces', lambda gray: detect(image, gray) if faces is None else faces, 'gray')
+			graph.add('smooth', lambda faces: smooth(image, faces), 'faces')
+		else:
+			graph.add('smooth', lambda: None)
+		graph.add('edges', lambda gray: find_edges(gray, arena=arena, **edges), 'gray')
+		graph.add('colour', lambda: self.colour(image, arena=arena, **settings))
+		# edges in black, the smoothed face blended back in and the contrast stretched, in one pass
+		graph.add('render', self.kernel(image.shape).render, 'colour', 'edges', 'smooth')
+		return graph
+
+	def strip_rows(self, image, faces, gray, detect, settings, edges=None):
+		""" tiled mode: the whole-photo steps, returns (face layer, colour rows(y0, y1), edge rows(y0, y1)) """
+		edges = edges or self.edges
+		face_layer = None
+		if self.face_weight:
+			face_layer = smooth(image, detect(image, gray) if faces is None else faces)
+		prepared = self.strips(image, **settings) if self.strips else None
+		if prepared is None:  # this colour step needs the whole photo at once, the strips just slice it
+			colours = self.colour(image, **settings)
+			colour_rows = lambda y0, y1: colours[y0:y1]
+		else:
+			colour_rows = rows_of(prepared[0], image, prepared[1])
+		halo = edge_halo(**edges)
+		if gray is None:
+			edge_rows = rows_of(lambda strip: find_edges(cv2.cvtColor(strip, cv2.COLOR_BGR2GRAY), **edges), image, halo)
+		else:
+			edge_rows = rows_of(lambda strip: find_edges(strip, **edges), gray, halo)
+		return face_layer, colour_rows, edge_rows
+
+STYLES = {}
+
+def register(style):
+	STYLES[style.name] = style
+	return style
+
+def get_style(name):
+	if name not in STYLES:
+		raise ValueError(f"Unknown style {name}, pick one of {', '.join(STYLES)}")
+	return STYLES[name]
+
+# ShPiBver1 / zoltar2: k-means colours, smoothed face blended back in
+register(Style('kmeans', quantize, strips=strip_quantizer))
+# DratsX3 / DratsX4 / zoltar: bilateral filter, their face blend never made it into the photo
+register(Style('bilateral', edge_preserving_smooth, edges={'median': 5, 'block_size': 9, 'c': 9}, face_weight=0, alpha=1.2, beta=20,
+	strips=strip_smoother))
+# same outlines and face as kmeans, colours from fixed levels
+register(Style('posterize', posterize, strips=lambda image, **settings: (lambda strip: posterize(strip, **settings), 0)))
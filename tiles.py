@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+""" strip-tiled cartoon + frame: the per-pixel stages run on horizontal strips, in parallel, for big sensors """
+
+import numpy as np
+
+#*#*# CHANGE ME *#*#*#
+STRIP_HEIGHT = 256   # photo rows per strip, memory in flight is about (threads x strip) instead of whole photos
+
+def rows_of(strip_func, image, halo):
+	""" rows(y0, y1) -> strip_func's output for those rows, run on them plus halo rows above and below """
+	def rows(y0, y1):
+		h0, h1 = max(0, y0 - halo), min(len(image), y1 + halo)
+		return strip_func(image[h0:h1])[y0 - h0:y1 - h0]
+	return rows
+
+def framed_strips(shape, colour_rows, edge_rows, face_layer, kernel, frame, compositor, top, bottom, pool,
+		strip_height=STRIP_HEIGHT):
+	""" renders and frames the photo one strip at a time on the pool, returns the framed BGRA canvas """
+	height, width = shape[:2]
+	compositor.prepare(frame, top, bottom)  # built here once, the strips only write their own rows of it
+
+	def strip(y0):
+		y1 = min(height, y0 + strip_height)
+		cartoon = np.empty((y1 - y0, width, 3), dtype=np.uint8)
+		kernel.render_strip(colour_rows(y0, y1), edge_rows(y0, y1), face_layer, np.empty_like(cartoon), cartoon, y0)
+		return compositor.blend_rows(cartoon, frame, top, bottom, y0)
+
+	canvas = None
+	for canvas in pool.map(strip, range(0, height, strip_height)):
+		pass
+	return canvas
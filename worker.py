@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+import os
+import queue
+import multiprocessing
+
+import pipeline
+
+#*#*# CHANGE ME *#*#*#
+WORKERS = 2   # cartoon jobs that can run at once (the quick preview and the full photo), each one is its own process
+CANCEL_SLOTS = 256   # job ids wrap around in the shared cancel flags, far more than are ever in flight
+
+class JobCancelled(Exception):
+	pass
+
+class ProcessingWorker:
+	""" runs process_image / process_preview in worker processes so the curses loop never blocks on OpenCV """
+	def __init__(self, workers=WORKERS):
+		# fork, not spawn: spawn would re-run ShPiBver1.py (camera, button) in every worker
+		context = multiprocessing.get_context('fork')
+		self.jobs = context.Queue()
+		self.events = context.Queue()  # completion channel: (job_id, kind, value)
+		self.cancelled = context.RawArray('b', CANCEL_SLOTS)  # shared with the workers
+		self.finished = {}  # job_id -> ('done', renditions) or ('error', message), until collected
+		self.running = {}  # worker pid -> job_id it is on, so a dead worker's job can be failed
+		self.next_id = 0
+		self.context = context
+		self.processes = [self._process() for _ in range(workers)]
+
+	def _process(self):
+		return self.context.Process(target=work, args=(self.jobs, self.events, self.cancelled), daemon=True)
+
+	def start(self):
+		for process in self.processes:
+			process.start()
+
+	def submit(self, image, file_path, choice, faces=None, gray=None, preview=False):
+		""" queues a cartoon job, returns its id """
+		job_id = self.next_id
+		self.next_id += 1
+		self.cancelled[job_id % CANCEL_SLOTS] = 0
+		self.jobs.put((job_id, preview, image, file_path, choice, faces, gray))
+		return job_id
+
+	def cancel(self, job_id):
+		""" the worker drops the job at its next stage, or skips it if it hasn't started """
+		self.cancelled[job_id % CANCEL_SLOTS] = 1
+		self.finished.pop(job_id, None)
+
+	def abandon(self, job_id):
+		""" cancels a job that stopped reaching stages, killing its worker (poll() starts a new one) """
+		self.cancel(job_id)
+		for process in self.processes:
+			if self.running.get(process.pid) == job_id:
+				process.kill()
+
+	def poll(self):
+		""" (job_id, stage) for every stage reached since the last poll, never waits; results go to self.finished,
+			a job whose worker died (e.g. the OOM killer at 12MP) finishes as an error and the worker is replaced """
+		stages = []
+		while True:
+			try:
+				job_id, kind, value = self.events.get_nowait()
+			except queue.Empty:
+				break
+			if kind == 'started':
+				self.running[value] = job_id
+			elif kind == 'stage':
+				stages.append((job_id, value))
+			else:
+				self.running = {pid: running for pid, running in self.running.items() if running != job_id}
+			if kind in ('done', 'error') and not self.cancelled[job_id % CANCEL_SLOTS]:
+				self.finished[job_id] = (kind, value)
+		for i, process in enumerate(self.processes):
+			if process.is_alive():
+				continue
+			job_id = self.running.pop(process.pid, None)
+			if job_id is not None and not self.cancelled[job_id % CANCEL_SLOTS]:
+				self.finished[job_id] = ('error', f'worker process died (exit code {process.exitcode})')
+			print(f'Cartoon worker {process.pid} exited with {process.exitcode}, starting a new one')
+			self.processes[i] = self._process()
+			self.processes[i].start()
+		return stages
+
+	def close(self):
+		for _ in self.processes:
+			self.jobs.put(None)
+		for process in self.processes:
+			process.join(timeout=5)
+
+def work(jobs, events, cancelled):
+	""" worker process loop, frames/palette/canvases are loaded once and reused per job """
+	while True:
+		job = jobs.get()
+		if job is None:
+			break
+		job_id, preview, image, file_path, choice, faces, gray = job
+		events.put((job_id, 'started', os.getpid()))
+		def progress(stage):
+			if cancelled[job_id % CANCEL_SLOTS]:
+				raise JobCancelled()
+			events.put((job_id, 'stage', stage))
+		try:
+			process = pipeline.process_preview if preview else pipeline.process_image
+			renditions = process(image, file_path, choice, faces, gray, progress)
+			events.put((job_id, 'done', renditions))
+		except JobCancelled:
+			events.put((job_id, 'cancelled', None))
+		except Exception as e:
+			events.put((job_id, 'error', f'{type(e).__name__}: {e}'))